@@ -0,0 +1,157 @@
+"""Audit trail of the token lifecycle events (codes, tokens, consents...)."""
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import deque
+from pathlib import Path
+from time import time
+from typing import Any, Literal
+
+from authentic.logger import logger
+
+OverflowPolicy = Literal["drop_oldest", "drop_newest"]
+
+
+def fingerprint(secret: str) -> str:
+    """Non-reversible identifier of a code or token, so secrets never reach the audit files."""
+    return hashlib.sha256(secret.encode()).hexdigest()[:16]
+
+
+class RotatingJsonLinesWriter:
+    """
+    Append-only JSON lines file, rotated to `<path>.1` ... `<path>.<backup_count>`
+    once it grows beyond max_bytes. Each batch is written and fsynced at once.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 10_000_000, backup_count: int = 5):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+
+    def write_batch(self, records: list[dict[str, Any]]) -> None:
+        # Fields that are not JSON serializable are written as strings rather than failing the batch
+        data = b"".join(json.dumps(record, separators=(",", ":"), default=str).encode() + b"\n" for record in records)
+        if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            backup = self.path.with_name(f"{self.path.name}.{i}")
+            if backup.exists():
+                backup.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class AuditLog:
+    """
+    Buffered audit log of the token lifecycle events.
+
+    emit() only appends the event to an in-memory ring buffer, so requests never
+    wait on disk. A background task drains the buffer in batches (every
+    flush_interval seconds, or as soon as batch_size events are waiting) and
+    writes them to the rotating JSON lines files from a worker thread.
+
+    When the buffer is full, the overflow policy decides which event is lost:
+    the oldest buffered one ("drop_oldest") or the incoming one ("drop_newest").
+    Either way the loss is not silent: the count of dropped events is written to
+    the log itself as an "audit_events_dropped" event with the next batch.
+    """
+
+    def __init__(
+        self,
+        writer: RotatingJsonLinesWriter,
+        buffer_size: int = 10_000,
+        batch_size: int = 512,
+        flush_interval: float = 1.0,
+        overflow: OverflowPolicy = "drop_oldest",
+    ):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._pending_flush = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """Record an event. Never blocks, the fields should be JSON serializable."""
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            self._buffer.popleft()
+        self._buffer.append({"ts": time(), "event": event, **fields})
+        if len(self._buffer) >= self.batch_size:
+            self._pending_flush.set()
+
+    async def start(self) -> None:
+        """Start the background flushing task."""
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._pending_flush.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                # Keep the events buffered (up to the overflow policy) and retry on the next round
+                logger.error(f"Error writing the audit log: {e!r}")
+
+    async def flush(self) -> None:
+        """Write all the buffered events to disk."""
+        async with self._flush_lock:
+            self._pending_flush.clear()
+            while self._buffer or self.dropped:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if self.dropped:
+                    logger.warning(f"Audit buffer full, {self.dropped} events dropped ({self.overflow})")
+                    batch.append({"ts": time(), "event": "audit_events_dropped", "count": self.dropped, "policy": self.overflow})
+                    self.dropped = 0
+                try:
+                    await asyncio.to_thread(self.writer.write_batch, batch)
+                except Exception:
+                    self._requeue(batch)
+                    raise
+
+    def _requeue(self, batch: list[dict[str, Any]]) -> None:
+        # Put a failed batch back in front of the buffer, in its original order
+        self._buffer.extendleft(reversed(batch))
+        while len(self._buffer) > self.buffer_size:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                self._buffer.pop()
+            else:
+                self._buffer.popleft()
+
+    async def close(self) -> None:
+        """Stop the background task and write the remaining events."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.writer.close()
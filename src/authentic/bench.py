@@ -0,0 +1,168 @@
+"""
+Micro-benchmark of the introspection endpoint, the raw ASGI fast path against the
+starlette handler it falls back to.
+
+Both apps are called directly with synthetic ASGI messages, so only the endpoint
+is measured (no server nor routing). For each kind of request, it reports the
+requests per second and the peak of the memory allocated (as traced by
+tracemalloc) per call.
+
+Run it with `python -m authentic.bench --requests 100000`.
+"""
+
+import asyncio
+import secrets
+import tracemalloc
+from dataclasses import dataclass
+from time import perf_counter, time
+
+import typer
+from mcp.server.auth.provider import AccessToken
+from rich.console import Console
+from rich.table import Table
+from starlette.types import ASGIApp, Message
+
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.introspection import IntrospectionEndpoint
+from authentic.logger import configure_logger
+from authentic.oauth_server import build_oauth2_server
+from authentic.store.base import TOKENS
+
+ORIGIN = b"http://localhost:3000"
+
+
+@dataclass
+class BenchCase:
+    name: str
+    scope: dict
+    body: bytes = b""
+
+
+@dataclass
+class BenchResult:
+    case: str
+    app: str
+    requests_per_second: float
+    peak_bytes_per_call: float
+
+
+def build_cases(token: str) -> list[BenchCase]:
+    def scope(method: str, headers: list[tuple[bytes, bytes]]) -> dict:
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": "/introspect",
+            "raw_path": b"/introspect",
+            "query_string": b"",
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("localhost", 9000),
+        }
+
+    form = [(b"host", b"localhost:9000"), (b"content-type", b"application/x-www-form-urlencoded")]
+    preflight = [(b"origin", ORIGIN), (b"access-control-request-method", b"POST"), (b"access-control-request-headers", b"content-type")]
+    return [
+        BenchCase("active token", scope("POST", form), f"token={token}".encode()),
+        BenchCase("unknown token", scope("POST", form), b"token=unknown"),
+        BenchCase("cors active token", scope("POST", [*form, (b"origin", ORIGIN)]), f"token={token}".encode()),
+        BenchCase("preflight", scope("OPTIONS", preflight)),
+    ]
+
+
+async def call(app: ASGIApp, case: BenchCase) -> int:
+    """Call the app with the request of the case, returning the response status."""
+    status = 0
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": case.body, "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(case.scope, receive, send)
+    return status
+
+
+async def measure(app: ASGIApp, case: BenchCase, requests: int, traced: int) -> tuple[float, float]:
+    """Requests per second over requests calls, and mean peak of allocated bytes over traced calls."""
+    # Warm up (and check the app answers)
+    status = await call(app, case)
+    assert status in (200, 400), f"Unexpected status {status} for {case.name}"
+
+    start = perf_counter()
+    for _ in range(requests):
+        await call(app, case)
+    elapsed = perf_counter() - start
+
+    peaks = 0
+    tracemalloc.start()
+    try:
+        for _ in range(traced):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            await call(app, case)
+            peaks += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return requests / elapsed, peaks / traced
+
+
+async def run_bench(requests: int, traced: int) -> list[BenchResult]:
+    configure_logger("ERROR")
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), AuthServerSettings(auth_host="localhost", log_level="ERROR", _env_file=None))
+    provider = app.state.oauth_provider
+    endpoint = next(route.endpoint for route in app.routes if getattr(route, "path", None) == "/introspect")
+    assert isinstance(endpoint, IntrospectionEndpoint)
+
+    token = f"mcp_{secrets.token_hex(32)}"
+    expires_at = int(time()) + 3600
+    await provider.store.set(TOKENS, token, AccessToken(token=token, client_id="bench", scopes=["user"], expires_at=expires_at), ttl=3600)
+
+    results = []
+    for case in build_cases(token):
+        for name, bench_app in (("handler", endpoint.fallback), ("fast path", endpoint)):
+            rps, peak = await measure(bench_app, case, requests, traced)
+            results.append(BenchResult(case.name, name, rps, peak))
+    await provider.store.close()
+    return results
+
+
+def print_results(results: list[BenchResult], console: Console) -> None:
+    table = Table(title="Introspection endpoint")
+    table.add_column("Request")
+    table.add_column("App")
+    table.add_column("Requests/s", justify="right")
+    table.add_column("Peak bytes/call", justify="right")
+    table.add_column("Speedup", justify="right")
+    baselines = {}
+    for result in results:
+        baseline = baselines.setdefault(result.case, result)
+        table.add_row(
+            result.case,
+            result.app,
+            f"{result.requests_per_second:,.0f}",
+            f"{result.peak_bytes_per_call:,.0f}",
+            f"{result.requests_per_second / baseline.requests_per_second:.1f}x",
+        )
+    console.print(table)
+
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    requests: int = typer.Option(20_000, help="Requests timed per request kind and app"),
+    traced: int = typer.Option(1_000, help="Requests traced with tracemalloc per request kind and app"),
+) -> None:
+    print_results(asyncio.run(run_bench(requests, traced)), Console())
+
+
+if __name__ == "__main__":
+    app()
@@ -1,10 +1,32 @@
-from pydantic import AnyHttpUrl, Field, computed_field, model_validator
+from typing import Literal
+
+from pydantic import (
+    AnyHttpUrl,
+    Field,
+    SecretStr,
+    computed_field,
+    field_validator,
+    model_validator,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Default lifetimes (in seconds) of the artifacts issued by the provider
+FIVE_MINUTES = 300
+TEN_MINUTES = 600
+ONE_HOUR = 3600
+
+# Both settings classes share the same env file, so each one ignores the keys
+# that belong to the other
+AUTH_ENV_FILE = ".auth.env"
+
+LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")
+
 
 class SimpleAuthSettings(BaseSettings):
     """Simple OAuth settings for basic authentication purposes."""
 
+    model_config = SettingsConfigDict(env_file=AUTH_ENV_FILE, extra="ignore")
+
     # Basic authentication credentials
     username: str = "fps"
     password: str = "fps"
@@ -12,11 +34,17 @@ class SimpleAuthSettings(BaseSettings):
     # MCP OAuth scope
     mcp_scope: str = "user"
 
+    # Lifetimes of the issued artifacts
+    auth_code_expiry: int = Field(default=FIVE_MINUTES, gt=0, description="Authorization code lifetime in seconds")
+    access_token_expiry: int = Field(default=ONE_HOUR, gt=0, description="Access token lifetime in seconds")
+    flow_expiry: int = Field(default=TEN_MINUTES, gt=0, description="Lifetime in seconds of the pending authorizations and consents")
+    client_secret_expiry: int | None = Field(default=None, gt=0, description="Lifetime in seconds of the registered clients, forever if unset")
+
 
 class AuthServerSettings(BaseSettings):
     """Settings for the Authorization Server."""
 
-    model_config = SettingsConfigDict(env_file=".auth.env")
+    model_config = SettingsConfigDict(env_file=AUTH_ENV_FILE, extra="ignore")
 
     name: str = Field(default="Authentic", description="A simple authentication server")
 
@@ -33,6 +61,25 @@ class AuthServerSettings(BaseSettings):
     auth_port: int = Field(default=9000, description="Port to run the auth server on")
     auth_path: str = Field(default="/login")
 
+    # Provider state store settings
+    store_url: str | None = Field(default=None, description="URL of the shared store (redis://...), in-memory if unset")
+    store_pool_size: int = Field(default=10, gt=0, description="Max connections to the shared store")
+
+    # Sharding settings, codes and tokens are partitioned across the nodes when node_id is set
+    node_id: str | None = Field(default=None, description="Id of this node in the hash ring")
+    shard_secret: SecretStr | None = Field(default=None, description="Secret shared by the nodes to checksum the codes and tokens")
+    shard_count: int = Field(default=256, gt=0, le=65536, description="Number of shards spread over the nodes")
+    shard_peers: dict[str, str] = Field(default_factory=dict, description="Store URL of every other node, by node id")
+
+    # Audit log settings
+    audit_log_path: str | None = Field(default=None, description="JSON lines file of the audit log, disabled if unset")
+    audit_buffer_size: int = Field(default=10_000, gt=0, description="Max audit events buffered in memory")
+    audit_batch_size: int = Field(default=512, gt=0, description="Max audit events written (and fsynced) at once")
+    audit_flush_interval: float = Field(default=1.0, gt=0, description="Seconds between audit log flushes")
+    audit_max_bytes: int = Field(default=10_000_000, gt=0, description="Size of the audit log file before rotating it")
+    audit_backup_count: int = Field(default=5, ge=0, description="Number of rotated audit log files to keep")
+    audit_overflow: Literal["drop_oldest", "drop_newest"] = Field(default="drop_oldest", description="Audit event dropped when the buffer is full")
+
     @computed_field
     @property
     def auth_server_base_url(self) -> AnyHttpUrl:
@@ -51,6 +98,15 @@ class AuthServerSettings(BaseSettings):
         auth_path = self.auth_path.lstrip("/")
         return AnyHttpUrl(f"{base_url}/{auth_path}")
 
+    @field_validator("log_level")
+    @classmethod
+    def validate_log_level(cls, value: str) -> str:
+        """Normalize log_level and reject levels unknown to the logger."""
+        value = value.upper()
+        if value not in LOG_LEVELS:
+            raise ValueError(f"Invalid log level {value!r}, expected one of {', '.join(LOG_LEVELS)}")
+        return value
+
     @model_validator(mode="after")
     def override_log_level(self) -> "AuthServerSettings":
         """Override log_level to DEBUG if debug flag is True."""
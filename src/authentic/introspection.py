@@ -0,0 +1,167 @@
+"""Raw ASGI fast path of the token introspection endpoint (RFC 7662)."""
+
+from json.encoder import encode_basestring
+from time import time
+from urllib.parse import unquote_plus
+
+from mcp.server.streamable_http import MCP_PROTOCOL_VERSION_HEADER
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from authentic.audit import fingerprint
+from authentic.oauth_provider import SimpleOAuthProvider
+
+FORM_CONTENT_TYPE = b"application/x-www-form-urlencoded"
+
+# CORS policy of the endpoint, the same the mcp auth routes get from cors_middleware
+ALLOW_METHODS = ("POST", "OPTIONS")
+ALLOW_HEADERS = sorted({"Accept", "Accept-Language", "Content-Language", "Content-Type", MCP_PROTOCOL_VERSION_HEADER})
+MAX_AGE = b"600"
+
+# Prebuilt fragments of the responses
+INACTIVE_BODY = b'{"active":false}'
+ACTIVE_PREFIX = b'{"active":true,"client_id":'
+JSON_HEADER = (b"content-type", b"application/json")
+
+
+def _json_string(value: str | None) -> bytes:
+    # Same encoding as JSONResponse (no ASCII escaping)
+    return b"null" if value is None else encode_basestring(value).encode()
+
+
+def _response(status: int, body: bytes, headers: list[tuple[bytes, bytes]]) -> tuple[dict, dict]:
+    """Start and body messages of a response."""
+    start = {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-length", str(len(body)).encode()), *headers],
+    }
+    return start, {"type": "http.response.body", "body": body}
+
+
+def _preflight_responses() -> dict[tuple[str, ...], tuple[dict, dict]]:
+    """Preflight responses by the failed checks, as returned by starlette's CORSMiddleware."""
+    headers = [
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-allow-methods", ", ".join(ALLOW_METHODS).encode()),
+        (b"access-control-max-age", MAX_AGE),
+        (b"access-control-allow-headers", ", ".join(ALLOW_HEADERS).encode()),
+        (b"content-type", b"text/plain; charset=utf-8"),
+    ]
+    responses = {}
+    for failures in ((), ("method",), ("headers",), ("method", "headers")):
+        if failures:
+            responses[failures] = _response(400, f"Disallowed CORS {', '.join(failures)}".encode(), headers)
+        else:
+            responses[failures] = _response(200, b"OK", headers)
+    return responses
+
+
+class IntrospectionEndpoint:
+    """
+    Token introspection endpoint working directly on the ASGI messages.
+
+    It answers the same as the starlette handler wrapped by cors_middleware, but
+    the urlencoded body is parsed straight from the received bytes, the expiry is
+    checked inline and the JSON is assembled from prebuilt fragments. Preflight
+    responses are precomputed. Other bodies (e.g. multipart) go to the fallback app.
+    """
+
+    def __init__(self, oauth_provider: SimpleOAuthProvider, fallback: ASGIApp):
+        self.oauth_provider = oauth_provider
+        self.fallback = fallback
+        # The messages are sent as is, nothing in the app mutates them
+        self.preflight = _preflight_responses()
+        self.allow_headers = {header.lower() for header in ALLOW_HEADERS}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        origin = content_type = cookie = request_method = request_headers = None
+        for name, value in scope["headers"]:
+            match name:
+                case b"origin":
+                    origin = value
+                case b"content-type":
+                    content_type = value
+                case b"cookie":
+                    cookie = value
+                case b"access-control-request-method":
+                    request_method = value
+                case b"access-control-request-headers":
+                    request_headers = value
+
+        if origin is not None and request_method is not None and scope["method"] == "OPTIONS":
+            start, body = self.preflight[self._preflight_failures(request_method, request_headers)]
+            await send(start)
+            await send(body)
+            return
+
+        # Without a content type the form is empty, any other than urlencoded goes the slow way
+        if content_type is not None and content_type.split(b";", 1)[0].strip().lower() != FORM_CONTENT_TYPE:
+            await self.fallback(scope, receive, send)
+            return
+
+        headers = [JSON_HEADER]
+        if origin is not None:
+            # A wildcard origin is not allowed along with cookies, mirror the origin instead
+            if cookie is None:
+                headers.append((b"access-control-allow-origin", b"*"))
+            else:
+                headers += [(b"access-control-allow-origin", origin), (b"vary", b"Origin")]
+
+        token = await self._read_token(receive) if content_type is not None else None
+        start, body = _response(*await self._introspect(token), headers)
+        await send(start)
+        await send(body)
+
+    def _preflight_failures(self, request_method: bytes, request_headers: bytes | None) -> tuple[str, ...]:
+        failures = ()
+        if request_method.decode("latin-1") not in ALLOW_METHODS:
+            failures += ("method",)
+        if request_headers is not None and any(
+            header.strip() not in self.allow_headers for header in request_headers.decode("latin-1").lower().split(",")
+        ):
+            failures += ("headers",)
+        return failures
+
+    @staticmethod
+    async def _read_token(receive: Receive) -> str | None:
+        """Read the body and get its (last) token field."""
+        message = await receive()
+        body = message.get("body", b"")
+        if message.get("more_body", False):
+            chunks = [body]
+            while message.get("more_body", False):
+                message = await receive()
+                chunks.append(message.get("body", b""))
+            body = b"".join(chunks)
+
+        token = None
+        for field in body.split(b"&"):
+            if field.startswith(b"token="):
+                token = field[6:]
+        if not token:
+            return None
+        if b"%" in token or b"+" in token:
+            return unquote_plus(token.decode("utf-8", "replace"))
+        return token.decode("utf-8", "replace")
+
+    async def _introspect(self, token: str | None) -> tuple[int, bytes]:
+        oauth_provider = self.oauth_provider
+        if not token:
+            oauth_provider.audit_event("introspection_failed", reason="missing_token")
+            return 400, INACTIVE_BODY
+
+        now = time()
+        access_token = await oauth_provider.find_access_token(token, now)
+        if not access_token:
+            oauth_provider.audit_event("introspection_failed", reason="inactive_token", token=fingerprint(token))
+            return 200, INACTIVE_BODY
+
+        exp = b"null" if access_token.expires_at is None else str(access_token.expires_at).encode()
+        return 200, b"".join((
+            ACTIVE_PREFIX, _json_string(access_token.client_id),
+            b',"scope":', _json_string(" ".join(access_token.scopes)),
+            b',"exp":', exp,
+            b',"iat":', str(int(now)).encode(),
+            b',"token_type":"Bearer","aud":', _json_string(access_token.resource),
+            b"}",
+        ))
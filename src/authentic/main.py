@@ -2,15 +2,18 @@
 
 import asyncio
 import os
+import signal
 import sys
 
 import typer
 from rich.console import Console
 from rich.panel import Panel
 
-from authentic.oauth_server import build_oauth2_server
+from authentic.oauth_server import build_oauth2_server, reload_oauth2_server, reshard_oauth2_server
 from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
 from authentic.logger import configure_logger, logger
+from pydantic import ValidationError
+from starlette.applications import Starlette
 from uvicorn import Config, Server
 
 # https://dev.to/composiodev/mcp-oauth-21-a-complete-guide-3g91
@@ -20,24 +23,81 @@ from uvicorn import Config, Server
 console = Console()
 app = typer.Typer()
 
-async def start_server(auth_server_settings: AuthServerSettings, auth_settings: SimpleAuthSettings) -> None:
+# Keep the background tasks referenced until they are done
+_background_tasks: set[asyncio.Task] = set()
+
+def load_settings(debug: bool) -> tuple[AuthServerSettings, SimpleAuthSettings]:
+    """Read and validate the settings from the environment and the .auth.env file."""
+    auth_server_settings = AuthServerSettings(debug=debug)
+    auth_settings = SimpleAuthSettings()
+
+    if debug:
+        auth_server_settings.log_level = "DEBUG"
+    return auth_server_settings, auth_settings
+
+
+def reload_settings(auth_server: Starlette, debug: bool) -> None:
+    """Re-read the settings and apply them to the running server, keeping its state.
+
+    Invalid settings are logged and ignored, so the server keeps running with the
+    previous ones. Changed shard peers are applied by resharding in the background.
+    Host, port, store, audit log and the rest of the sharding settings are set up at
+    startup and need a restart to change, a warning lists the ones changed since the
+    previous load.
+    """
+    logger.info("Reloading settings...")
+    previous_auth_server_settings: AuthServerSettings = auth_server.state.auth_server_settings
+    try:
+        new_auth_server_settings, new_auth_settings = load_settings(debug)
+        reload_oauth2_server(auth_server, new_auth_settings, new_auth_server_settings)
+    except (ValidationError, ValueError) as e:
+        logger.error(f"Invalid settings, keeping the current ones: {e}")
+        return
+
+    if new_auth_server_settings.shard_peers != auth_server.state.shard_peers:
+        task = asyncio.get_running_loop().create_task(reshard(auth_server, new_auth_server_settings))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    startup_fields = [
+        field for field in AuthServerSettings.model_fields
+        if field in ("host", "port", "node_id") or (field.startswith(("store_", "audit_", "shard_")) and field != "shard_peers")
+    ]
+    changed = [f for f in startup_fields if getattr(new_auth_server_settings, f) != getattr(previous_auth_server_settings, f)]
+    if changed:
+        logger.warning(f"Changes to {', '.join(changed)} only take effect after a restart")
+
+
+async def reshard(auth_server: Starlette, auth_server_settings: AuthServerSettings) -> None:
+    """Move the codes and tokens to the ring of the new shard peers, logging the outcome."""
+    try:
+        moved = await reshard_oauth2_server(auth_server, auth_server_settings)
+    except Exception as e:
+        logger.error(f"Resharding failed: {e}")
+        return
+    logger.info(f"Resharded to peers {sorted(auth_server_settings.shard_peers)}, moved {moved} codes/tokens")
+
+
+async def start_server(auth_server_settings: AuthServerSettings, auth_settings: SimpleAuthSettings, debug: bool = False) -> None:
     
     auth_server = build_oauth2_server(auth_settings, auth_server_settings)
 
     config = Config(app=auth_server, host=auth_server_settings.host, port=auth_server_settings.port)
     
     server = Server(config)
+
+    # SIGHUP reloads the settings in place (send it with `kill -HUP <pid>`)
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, reload_settings, auth_server, debug
+        )
     await server.serve()
 
 @app.command()
 def main(
     debug: bool = typer.Option(False, "--debug", help="Enable debug mode"),
 ) -> None:
-    auth_server_settings = AuthServerSettings(debug=debug)
-    auth_settings = SimpleAuthSettings()
-    
-    if debug:
-        auth_server_settings.log_level = "DEBUG"
+    auth_server_settings, auth_settings = load_settings(debug)
 
     # Configure logger with settings (overrides default configuration)
     configure_logger(auth_server_settings.log_level)
@@ -53,7 +113,7 @@ def main(
     console.print(Panel(welcome_text, title="Authentic", border_style="blue"))
 
     # Start the server
-    asyncio.run(start_server(auth_server_settings, auth_settings))
+    asyncio.run(start_server(auth_server_settings, auth_settings, debug))
 
 
 if __name__ == "__main__":
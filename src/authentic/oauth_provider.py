@@ -16,14 +16,15 @@ from mcp.server.auth.provider import (
 )
 from mcp.shared.auth import OAuthClientInformationFull, OAuthToken
 
+from authentic.audit import AuditLog, fingerprint
 from authentic.config.auth import SimpleAuthSettings
 from authentic.logger import logger
+from authentic.sharding import ShardRouter
+from authentic.store import MemoryStore, OAuthStore
+from authentic.store.base import AUTH_CODES, CLIENTS, PENDING_CONSENT, STATE_MAPPING, TOKENS, USER_DATA
 from authentic.utils import load_template
 
 
-FIVE_MINUTES = 300
-ONE_HOUR = 3600
-
 class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, RefreshToken, AccessToken]):
     """
     Simple OAuth provider for demo purposes.
@@ -33,28 +34,60 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
     2. Showing a consent screen for resource access
     3. Issuing MCP tokens after successful authentication and consent
     4. Maintaining token state for introspection
+
+    All the state (clients, codes, tokens, flow state, user and consent data) lives
+    in the store, in memory by default or shared between instances. With sharding,
+    codes and tokens are instead kept by the node owning their shard, and the
+    registered clients by all the nodes. The token lifecycle events are recorded
+    in the audit log, if any.
     """
 
-    def __init__(self, settings: SimpleAuthSettings, auth_url: str, server_url: str):
+    def __init__(self, settings: SimpleAuthSettings, auth_url: str, server_url: str, store: OAuthStore | None = None, audit: AuditLog | None = None, sharding: ShardRouter | None = None):
         self.settings = settings
         self.auth_url = auth_url
         self.server_url = server_url
-        self.clients: dict[str, OAuthClientInformationFull] = {}
-        self.auth_codes: dict[str, AuthorizationCode] = {}
-        self.tokens: dict[str, AccessToken] = {}
-        self.state_mapping: dict[str, dict[str, str | None]] = {}
-        # Store authenticated user information and consent data
-        self.user_data: dict[str, dict[str, Any]] = {}
-        self.pending_consent: dict[str, dict[str, Any]] = {}
+        self.store = store or MemoryStore()
+        self.audit = audit
+        self.sharding = sharding
+
+    def update_settings(self, settings: SimpleAuthSettings, auth_url: str, server_url: str) -> None:
+        """Swap the provider settings in place, keeping all the flow and token state.
+
+        The three attributes are assigned without yielding to the event loop, so
+        no request handler can observe a mix of old and new values.
+        """
+        self.settings, self.auth_url, self.server_url = settings, auth_url, server_url
+        logger.info(f"Provider settings updated: auth_url={auth_url}, server_url={server_url}")
+
+    def audit_event(self, event: str, **fields: Any) -> None:
+        """Record an event in the audit log (codes and tokens must be passed through fingerprint)."""
+        if self.audit:
+            self.audit.emit(event, **fields)
+
+    def _new_token(self, size: int) -> str:
+        """Generate a code or token with size random bytes (on a shard of this node with sharding)."""
+        if self.sharding:
+            return self.sharding.mint(size)
+        return f"mcp_{secrets.token_hex(size)}"
+
+    def _store_for(self, token: str) -> OAuthStore | None:
+        """Store keeping a code or token, None if it is malformed (only detected with sharding)."""
+        if self.sharding:
+            return self.sharding.store_for(token)
+        return self.store
 
     async def get_client(self, client_id: str) -> OAuthClientInformationFull | None:
         """Get OAuth client information."""
-        logger.info(f"Getting client information for client_id: {client_id}: {self.clients.get(client_id)}")
-        return self.clients.get(client_id)
+        client = await self.store.get(CLIENTS, client_id)
+        logger.info(f"Getting client information for client_id: {client_id}: {client}")
+        return client
 
     async def register_client(self, client_info: OAuthClientInformationFull):
         """Register a new OAuth client."""
-        self.clients[client_info.client_id] = client_info
+        # A client with an expired secret can't authenticate anymore, so it can go away
+        ttl = client_info.client_secret_expires_at - time() if client_info.client_secret_expires_at else None
+        for store in self.sharding.stores.values() if self.sharding else [self.store]:
+            await store.set(CLIENTS, client_info.client_id, client_info, ttl=ttl)
 
     async def authorize(self, client: OAuthClientInformationFull, params: AuthorizationParams) -> str:
         """Generate an authorization URL for simple login flow."""
@@ -63,13 +96,13 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
         logger.info(f"Authorizing client: {client.client_id} with params: {params}")
 
         # Store state mapping for callback
-        self.state_mapping[state] = {
+        await self.store.set(STATE_MAPPING, state, {
             "redirect_uri": str(params.redirect_uri),
             "code_challenge": params.code_challenge,
             "redirect_uri_provided_explicitly": str(params.redirect_uri_provided_explicitly),
             "client_id": client.client_id,
             "resource": params.resource,  # RFC 8707
-        }
+        }, ttl=self.settings.flow_expiry)
 
         # Build simple login URL that points to login page
         auth_url = f"{self.auth_url}?state={state}&client_id={client.client_id}"
@@ -108,10 +141,9 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
             
     async def get_tools_consent_page(self, consent_token: str) -> HTMLResponse:
         """Generate consent page HTML for the given consent token."""
-        if not consent_token or consent_token not in self.pending_consent:
+        consent_data = await self.store.get(PENDING_CONSENT, consent_token) if consent_token else None
+        if not consent_data:
             raise HTTPException(400, "Invalid or missing consent token")
-
-        consent_data = self.pending_consent[consent_token]
         
         # Define the tools that will be accessible
         available_tools = [
@@ -184,7 +216,7 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
         if username != self.settings.username or password != self.settings.password:
             raise HTTPException(401, "Invalid credentials")
 
-        state_data = self.state_mapping.get(state)
+        state_data = await self.store.get(STATE_MAPPING, state)
         if not state_data:
             raise HTTPException(400, "Invalid state parameter")
 
@@ -192,12 +224,12 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
         consent_token = f"consent_{secrets.token_hex(16)}"
         client = await self.get_client(state_data["client_id"])
         
-        self.pending_consent[consent_token] = {
+        await self.store.set(PENDING_CONSENT, consent_token, {
             "username": username,
             "state": state,
             "client_name": client.client_name if client else "Unknown Application",
             "authenticated_at": time()
-        }
+        }, ttl=self.settings.flow_expiry)
 
         # Redirect to consent page
         consent_url = f"{self.server_url.rstrip('/')}/consent?token={consent_token}"
@@ -215,7 +247,7 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
         if not isinstance(consent_token, str) or not isinstance(action, str):
             raise HTTPException(400, "Invalid parameter types")
 
-        consent_data = self.pending_consent.get(consent_token)
+        consent_data = await self.store.get(PENDING_CONSENT, consent_token)
         if not consent_data:
             raise HTTPException(400, "Invalid or expired consent token")
 
@@ -225,10 +257,11 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
         match action.lower():
             case "deny":
                 # Clean up consent data but keep state mapping for potential retry
-                del self.pending_consent[consent_token]
+                await self.store.delete(PENDING_CONSENT, consent_token)
                 
                 # Create retry URL
-                state_data = self.state_mapping.get(state)
+                state_data = await self.store.get(STATE_MAPPING, state)
+                self.audit_event("consent_denied", username=username, client_id=state_data["client_id"] if state_data else None)
                 retry_url = f"{self.server_url.rstrip('/')}/login?state={state}&client_id={state_data['client_id']}" if state_data else "#"
                 logger.debug(f"Retry URL: {retry_url}")
                 try:
@@ -248,10 +281,13 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
                     """, status_code=403)
 
             case "approve":
-                # Clean up consent data
-                del self.pending_consent[consent_token]                
-                # Continue with authorization code flow
+                # Clean up consent data, only the first approval of a consent goes through
+                if not await self.store.pop(PENDING_CONSENT, consent_token):
+                    raise HTTPException(400, "Invalid or expired consent token")
+                # Continue with authorization code flow, the approval is only recorded once the code is issued
+                state_data = await self.store.get(STATE_MAPPING, state)
                 redirect_uri = await self.handle_simple_callback(username, "", state, skip_auth=True)
+                self.audit_event("consent_approved", username=username, client_id=state_data["client_id"])
                 logger.warning(f"redirecting to: {redirect_uri}")
                 return RedirectResponse(url=redirect_uri, status_code=302)
             case _:
@@ -259,7 +295,7 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
 
     async def handle_simple_callback(self, username: str, password: str, state: str, skip_auth: bool = False) -> str:
         """Handle simple authentication callback and return redirect URI."""
-        state_data = self.state_mapping.get(state)
+        state_data = await self.store.get(STATE_MAPPING, state)
         if not state_data:
             raise HTTPException(400, "Invalid state parameter")
 
@@ -280,28 +316,29 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
             raise HTTPException(401, "Invalid credentials")
 
         # Create MCP authorization code
-        new_code = f"mcp_{secrets.token_hex(16)}"
+        new_code = self._new_token(16)
         auth_code = AuthorizationCode(
             code=new_code,
             client_id=client_id,
             redirect_uri=AnyHttpUrl(redirect_uri),
             redirect_uri_provided_explicitly=redirect_uri_provided_explicitly,
-            expires_at=time() + FIVE_MINUTES,
+            expires_at=time() + self.settings.auth_code_expiry,
             scopes=[self.settings.mcp_scope],
             code_challenge=code_challenge,
             resource=resource,  # RFC 8707
         )
-        self.auth_codes[new_code] = auth_code
+        await self._store_for(new_code).set(AUTH_CODES, new_code, auth_code, ttl=self.settings.auth_code_expiry)
 
         # Store user data
-        self.user_data[username] = {
+        await self.store.set(USER_DATA, username, {
             "username": username,
             "user_id": f"user_{secrets.token_hex(8)}",
             "authenticated_at": time(),
-        }
+        })
 
         # Only delete state mapping after successful completion
-        del self.state_mapping[state]
+        await self.store.delete(STATE_MAPPING, state)
+        self.audit_event("code_issued", client_id=client_id, username=username, code=fingerprint(new_code), expires_at=auth_code.expires_at)
         return construct_redirect_uri(redirect_uri, code=new_code, state=state)
 
 
@@ -311,41 +348,80 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
     
     async def load_authorization_code(self, client: OAuthClientInformationFull, authorization_code: str) -> AuthorizationCode | None:
         """Load an authorization code."""
-        return self.auth_codes.get(authorization_code)
+        store = self._store_for(authorization_code)
+        return await store.get(AUTH_CODES, authorization_code) if store else None
+
+    async def audit_code_exchange_failure(self, client_id: str | None, code: str | None, error: str, error_description: str | None) -> None:
+        """
+        Record a code exchange rejected by the token handler, which mostly happens
+        before the provider is involved, with the reason told from the code itself.
+        Redeemed codes are deleted, so a replayed code is recorded as unknown.
+        """
+        if not self.audit:
+            return
+        store = self._store_for(code) if code else None
+        auth_code = await store.get(AUTH_CODES, code) if store else None
+        description = error_description or ""
+        if error not in ("invalid_grant", "invalid_request"):
+            # Rejected before looking at the code (e.g. client authentication)
+            reason = error
+        elif auth_code is None:
+            reason = "unknown_code"
+        elif auth_code.client_id != client_id:
+            reason = "client_mismatch"
+        elif auth_code.expires_at < time():
+            reason = "expired_code"
+        elif "redirect_uri" in description:
+            reason = "redirect_uri_mismatch"
+        elif "code_verifier" in description:
+            reason = "pkce_failed"
+        else:
+            reason = error
+        self.audit_event("code_exchange_failed", client_id=client_id, code=fingerprint(code) if code else None, reason=reason, error_description=error_description)
     
     async def exchange_authorization_code(self, client: OAuthClientInformationFull, authorization_code: AuthorizationCode) -> OAuthToken:
         """Exchange authorization code for tokens."""
-        if authorization_code.code not in self.auth_codes:
+        # Consume the code atomically, so it can only be redeemed once, even across instances
+        code_store = self._store_for(authorization_code.code)
+        if not code_store or not await code_store.pop(AUTH_CODES, authorization_code.code):
+            self.audit_event("code_exchange_failed", client_id=client.client_id, code=fingerprint(authorization_code.code), reason="already_redeemed")
             raise ValueError("Invalid authorization code")
 
         # Generate MCP access token
-        mcp_token = f"mcp_{secrets.token_hex(32)}"
+        mcp_token = self._new_token(32)
+        expiry = self.settings.access_token_expiry
+        store = self._store_for(mcp_token)
 
         # Store MCP token
-        self.tokens[mcp_token] = AccessToken(
+        await store.set(TOKENS, mcp_token, AccessToken(
             token=mcp_token,
             client_id=client.client_id,
             scopes=authorization_code.scopes,
-            expires_at=int(time()) + ONE_HOUR,
+            expires_at=int(time()) + expiry,
             resource=authorization_code.resource,  # RFC 8707
-        )
+        ), ttl=expiry)
 
         # Store user data mapping for this token
-        self.user_data[mcp_token] = {
+        await store.set(USER_DATA, mcp_token, {
             "username": self.settings.username,
             "user_id": f"user_{secrets.token_hex(8)}",
             "authenticated_at": time(),
-        }
-        # Delete authorization code
-        del self.auth_codes[authorization_code.code]
-
+        }, ttl=expiry)
+        self.audit_event(
+            "token_issued",
+            client_id=client.client_id,
+            code=fingerprint(authorization_code.code),
+            token=fingerprint(mcp_token),
+            scopes=authorization_code.scopes,
+            expires_in=expiry,
+        )
 
         logger.info(f"Exchanging authorization code: {authorization_code.code} for token: {mcp_token}")
         
         new_token = OAuthToken(
             access_token=mcp_token,
             token_type="Bearer",
-            expires_in=ONE_HOUR,
+            expires_in=expiry,
             scope=" ".join(authorization_code.scopes),
         )
         logger.info(f"New token: {new_token}")
@@ -353,19 +429,34 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
     
     async def load_access_token(self, token: str) -> AccessToken | None:
         """Load and validate an access token."""
-        access_token = self.tokens.get(token)
+        access_token = await self.find_access_token(token)
         logger.info(f"Loading access token: {token}: {access_token}")
-        if not access_token:
-            return None
+        return access_token
 
-        # Check if expired
-        if access_token.expires_at and access_token.expires_at < time():
-            del self.tokens[token]
-            logger.debug(f"Access token expired: {token}")
+    async def find_access_token(self, token: str, now: float | None = None) -> AccessToken | None:
+        """Get an access token valid at now (by default, the current time), dropping it along with its user data once expired."""
+        store = self._store_for(token)
+        access_token = await store.get(TOKENS, token) if store else None
+        if access_token and access_token.expires_at and access_token.expires_at < (time() if now is None else now):
+            await store.delete(TOKENS, token)
+            await store.delete(USER_DATA, token)
             return None
-
-        logger.debug(f"Loaded access token: {token}")
         return access_token
+
+    async def load_access_tokens(self, tokens: list[str]) -> list[AccessToken | None]:
+        """Load and validate several access tokens with a single lookup per store."""
+        by_store: dict[int, tuple[OAuthStore, list[int]]] = {}
+        for i, token in enumerate(tokens):
+            if store := self._store_for(token):
+                by_store.setdefault(id(store), (store, []))[1].append(i)
+
+        now = time()
+        access_tokens: list[AccessToken | None] = [None] * len(tokens)
+        for store, indexes in by_store.values():
+            for i, access_token in zip(indexes, await store.get_many(TOKENS, [tokens[i] for i in indexes]), strict=True):
+                if access_token and not (access_token.expires_at and access_token.expires_at < now):
+                    access_tokens[i] = access_token
+        return access_tokens
     
     async def load_refresh_token(self, client: OAuthClientInformationFull, refresh_token: str) -> RefreshToken | None:
         logger.warning("Refresh tokens not supported")
@@ -378,6 +469,8 @@ class SimpleOAuthProvider(OAuthAuthorizationServerProvider[AuthorizationCode, Re
     
     async def revoke_token(self, token: AccessToken | RefreshToken) -> None:
         """Revoke a token."""
-        if isinstance(token, AccessToken) and token.token in self.tokens:
-            del self.tokens[token.token]
+        store = self._store_for(token.token) if isinstance(token, AccessToken) else None
+        if store and await store.delete(TOKENS, token.token):
+            await store.delete(USER_DATA, token.token)
+            self.audit_event("token_revoked", client_id=token.client_id, token=fingerprint(token.token))
             logger.debug(f"Revoked access token: {token.token}")
@@ -1,3 +1,6 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from time import time
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
@@ -5,24 +8,162 @@ from starlette.routing import Route
 from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
 from starlette.applications import Starlette
 
-from mcp.server.auth.routes import cors_middleware, create_auth_routes
+from mcp.server.auth.handlers.token import TokenHandler
+from mcp.server.auth.middleware.client_auth import ClientAuthenticator
+from mcp.server.auth.routes import TOKEN_PATH, cors_middleware, create_auth_routes
 from mcp.server.auth.settings import AuthSettings, ClientRegistrationOptions
 
+from authentic.audit import AuditLog, RotatingJsonLinesWriter, fingerprint
+from authentic.introspection import IntrospectionEndpoint
 from authentic.oauth_provider import SimpleOAuthProvider
+from authentic.sharding import HashRing, ShardedTokenCodec, ShardRouter
+from authentic.store import OAuthStore, create_store
 from starlette.exceptions import HTTPException
 
-from authentic.logger import logger
+from authentic.logger import configure_logger, logger
+
+# Seconds left to the requests in flight before closing the clients of the peers removed by a reshard
+RETIRED_STORE_GRACE = 5.0
 
 def build_oauth2_server(auth_settings: SimpleAuthSettings, auth_server_settings: AuthServerSettings) -> Starlette:
     
-    oauth_provider = SimpleOAuthProvider(auth_settings, str(auth_server_settings.auth_url), str(auth_server_settings.auth_server_base_url))
-    
+    store = create_store(auth_server_settings.store_url, auth_server_settings.store_pool_size)
+    audit = build_audit_log(auth_server_settings)
+    sharding = build_shard_router(auth_server_settings, store)
+    oauth_provider = SimpleOAuthProvider(auth_settings, str(auth_server_settings.auth_url), str(auth_server_settings.auth_server_base_url), store, audit, sharding)
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        if audit:
+            await audit.start()
+        yield
+        if audit:
+            await audit.close()
+        for peer_store in sharding.stores.values() if sharding else []:
+            if peer_store is not store:
+                await peer_store.close()
+        await store.close()
+
+    app = Starlette(routes=build_routes(oauth_provider, auth_settings, auth_server_settings), lifespan=lifespan)
+    # Keep the provider reachable so the app can be reloaded without losing its state
+    app.state.oauth_provider = oauth_provider
+    app.state.auth_server_settings = auth_server_settings
+    app.state.shard_peers = auth_server_settings.shard_peers
+    app.state.reshard_lock = asyncio.Lock()
+    return app
+
+
+def build_audit_log(auth_server_settings: AuthServerSettings) -> AuditLog | None:
+    if not auth_server_settings.audit_log_path:
+        return None
+    writer = RotatingJsonLinesWriter(
+        auth_server_settings.audit_log_path,
+        max_bytes=auth_server_settings.audit_max_bytes,
+        backup_count=auth_server_settings.audit_backup_count,
+    )
+    return AuditLog(
+        writer,
+        buffer_size=auth_server_settings.audit_buffer_size,
+        batch_size=auth_server_settings.audit_batch_size,
+        flush_interval=auth_server_settings.audit_flush_interval,
+        overflow=auth_server_settings.audit_overflow,
+    )
+
+
+def build_shard_router(auth_server_settings: AuthServerSettings, store: OAuthStore) -> ShardRouter | None:
+    if not auth_server_settings.node_id:
+        return None
+    if not auth_server_settings.shard_secret:
+        raise ValueError("Sharding requires a shard_secret shared by all the nodes")
+
+    stores = build_shard_stores(auth_server_settings, auth_server_settings.node_id, store)
+    ring = HashRing(stores.keys(), shards=auth_server_settings.shard_count)
+    return ShardRouter(auth_server_settings.node_id, ShardedTokenCodec(auth_server_settings.shard_secret.get_secret_value()), ring, stores)
+
+
+def build_shard_stores(
+    auth_server_settings: AuthServerSettings, node_id: str, store: OAuthStore, reusable: dict[str, OAuthStore] | None = None
+) -> dict[str, OAuthStore]:
+    """Store of every node of the ring: the one of this node, and a client of the store of every peer (from reusable if there)."""
+    if not all(auth_server_settings.shard_peers.values()):
+        raise ValueError("Every shard peer needs the URL of its store")
+    if auth_server_settings.shard_peers and not auth_server_settings.store_url:
+        # The shards of this node would be kept in memory, out of reach of its peers
+        raise ValueError("Sharding across peers requires a store_url they can reach")
+
+    reusable = reusable or {}
+    stores = {node_id: store}
+    for peer, url in auth_server_settings.shard_peers.items():
+        stores[peer] = reusable[peer] if peer in reusable else create_store(url, auth_server_settings.store_pool_size)
+    return stores
+
+
+async def reshard_oauth2_server(app: Starlette, auth_server_settings: AuthServerSettings, close_delay: float = RETIRED_STORE_GRACE) -> int:
+    """Switch a sharded server built by build_oauth2_server to the peers of the settings.
+
+    The codes and tokens of this node whose shard changes owner are moved to the
+    store of the new owner (see ShardRouter.rebalance), so every node of the old and
+    new rings has to be resharded. The clients of the peers whose URL is unchanged
+    are kept, the ones of removed peers are closed close_delay seconds after the
+    switch. Returns the number of codes and tokens moved.
+    """
+    oauth_provider: SimpleOAuthProvider = app.state.oauth_provider
+    sharding = oauth_provider.sharding
+    if not sharding:
+        raise ValueError("The server is not sharded, set node_id and restart it")
+
+    async with app.state.reshard_lock:
+        previous_stores = sharding.stores
+        reusable = {
+            peer: previous_stores[peer]
+            for peer, url in app.state.shard_peers.items()
+            if auth_server_settings.shard_peers.get(peer) == url and peer in previous_stores
+        }
+        stores = build_shard_stores(auth_server_settings, sharding.node_id, oauth_provider.store, reusable)
+        created = [peer_store for peer, peer_store in stores.items() if peer != sharding.node_id and peer not in reusable]
+        try:
+            moved = await sharding.rebalance(HashRing(stores.keys(), shards=sharding.ring.shards), stores)
+        except BaseException:
+            for peer_store in created:
+                await peer_store.close()
+            raise
+        app.state.shard_peers = auth_server_settings.shard_peers
+
+        retired = [peer_store for peer_store in previous_stores.values() if all(peer_store is not s for s in stores.values())]
+        if retired:
+            await asyncio.sleep(close_delay)
+            for peer_store in retired:
+                await peer_store.close()
+    return moved
+
+
+def reload_oauth2_server(app: Starlette, auth_settings: SimpleAuthSettings, auth_server_settings: AuthServerSettings) -> None:
+    """Apply new settings to a running server built by build_oauth2_server.
+
+    The routes (and the metadata precomputed in them) are rebuilt first, so invalid
+    settings raise before anything is touched. Then the provider settings, the route
+    table and the log level are swapped without yielding to the event loop, so
+    in-flight flows and issued tokens, which live in the provider store, are preserved.
+    """
+    oauth_provider: SimpleOAuthProvider = app.state.oauth_provider
+    routes = build_routes(oauth_provider, auth_settings, auth_server_settings)
+
+    oauth_provider.update_settings(auth_settings, str(auth_server_settings.auth_url), str(auth_server_settings.auth_server_base_url))
+    app.router.routes = routes
+    app.state.auth_server_settings = auth_server_settings
+    configure_logger(auth_server_settings.log_level)
+    logger.info(f"Reloaded server settings: {auth_server_settings}")
+
+
+def build_routes(oauth_provider: SimpleOAuthProvider, auth_settings: SimpleAuthSettings, auth_server_settings: AuthServerSettings) -> list[Route]:
+
     mcp_auth_settings = AuthSettings(
         issuer_url=auth_server_settings.auth_server_base_url,
         client_registration_options=ClientRegistrationOptions(
             enabled=True,
             valid_scopes=[auth_settings.mcp_scope],
             default_scopes=[auth_settings.mcp_scope],
+            client_secret_expiry_seconds=auth_settings.client_secret_expiry,
         ),
         required_scopes=[auth_settings.mcp_scope],
         resource_server_url=None
@@ -35,6 +176,27 @@ def build_oauth2_server(auth_settings: SimpleAuthSettings, auth_server_settings:
         revocation_options=mcp_auth_settings.revocation_options,
     )
 
+    # Token handler recording the rejected code exchanges, most of them never reach the provider
+    token_handler = TokenHandler(oauth_provider, ClientAuthenticator(oauth_provider))
+
+    async def audited_token_handler(request: Request) -> Response:
+        response = await token_handler.handle(request)
+        if response.status_code >= 400 and oauth_provider.audit:
+            # The form was parsed (and cached) by the token handler
+            form = await request.form()
+            if form.get("grant_type") == "authorization_code":
+                error = json.loads(response.body)
+                await oauth_provider.audit_code_exchange_failure(
+                    form.get("client_id"), form.get("code"), error["error"], error.get("error_description")
+                )
+        return response
+
+    routes = [
+        Route(TOKEN_PATH, endpoint=cors_middleware(audited_token_handler, ["POST", "OPTIONS"]), methods=["POST", "OPTIONS"])
+        if getattr(route, "path", None) == TOKEN_PATH else route
+        for route in routes
+    ]
+
     # Login page handler (GET)
     async def login_page_handler(request: Request) -> Response:
         """Show login form."""
@@ -82,11 +244,13 @@ def build_oauth2_server(auth_settings: SimpleAuthSettings, auth_server_settings:
         token = form.get("token")
         if not token or not isinstance(token, str):
             logger.info(f"Invalid token: {token}, type: {type(token)}")
+            oauth_provider.audit_event("introspection_failed", reason="missing_token")
             return JSONResponse({"active": False}, status_code=400)
 
         # Look up token in provider
         access_token = await oauth_provider.load_access_token(token)
         if not access_token:
+            oauth_provider.audit_event("introspection_failed", reason="inactive_token", token=fingerprint(token))
             logger.info(f"Invalid token in provider: {token}, access token: {access_token}, type: {type(access_token)}")
             return JSONResponse({"active": False})
 
@@ -105,10 +269,11 @@ def build_oauth2_server(auth_settings: SimpleAuthSettings, auth_server_settings:
         logger.info(f"New response: {new_response}")
         return new_response
 
+    # Raw ASGI fast path for urlencoded bodies (the usual ones), falling back to the handler above
     routes.append(
         Route(
             "/introspect",
-            endpoint=cors_middleware(introspect_handler, ["POST", "OPTIONS"]),
+            endpoint=IntrospectionEndpoint(oauth_provider, fallback=cors_middleware(introspect_handler, ["POST", "OPTIONS"])),
             methods=["POST", "OPTIONS"],
         )
     )
@@ -117,4 +282,4 @@ def build_oauth2_server(auth_settings: SimpleAuthSettings, auth_server_settings:
     logger.info(f"Routes: \n{'\n'.join([f'{route.path} -> {route.endpoint}' for route in routes])}")
     logger.info("--------------------------------")
 
-    return Starlette(routes=routes)
+    return routes
@@ -0,0 +1,274 @@
+"""Partitioning of the codes and tokens across several nodes, without a central store.
+
+Codes and tokens embed the shard they belong to and a checksum. Shards are spread
+over the nodes by a consistent hash ring, so any node can tell which node owns a
+code or token (and reject malformed ones) without any lookup.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import hmac
+import random
+import secrets
+from collections.abc import Iterable, Sequence
+from time import time
+from typing import Any
+
+from authentic.logger import logger
+from authentic.store import OAuthStore
+from authentic.store.base import AUTH_CODES, CLIENTS, TOKENS, USER_DATA
+
+# Length (hex chars) of the shard and checksum parts of the tokens
+SHARD_LENGTH = 4
+CHECKSUM_LENGTH = 16
+MAX_SHARDS = 16**SHARD_LENGTH
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardedTokenCodec:
+    """
+    Mints and checks codes and tokens of the form `<prefix>_<shard>_<random>_<checksum>`.
+
+    The checksum is a truncated HMAC of the rest of the token under the secret
+    shared by the nodes, so a token can only be checked (and its shard trusted)
+    by the cluster. Checking takes the same time for every token of a given size.
+    """
+
+    def __init__(self, secret: str, prefix: str = "mcp", sizes: Iterable[int] = (16, 32)):
+        self._key = secret.encode()
+        self.prefix = prefix
+        # Lengths of the tokens minted with the given number of random bytes
+        self._lengths = {len(prefix) + 2 * size + SHARD_LENGTH + CHECKSUM_LENGTH + 3 for size in sizes}
+
+    def _checksum(self, body: str) -> str:
+        return hmac.new(self._key, body.encode(), hashlib.sha256).hexdigest()[:CHECKSUM_LENGTH]
+
+    def mint(self, shard: int, size: int) -> str:
+        """Mint a token for the shard with size random bytes."""
+        body = f"{self.prefix}_{shard:0{SHARD_LENGTH}x}_{secrets.token_hex(size)}"
+        return f"{body}_{self._checksum(body)}"
+
+    def parse(self, token: str) -> int | None:
+        """Get the shard of a token, or None if it was not minted by the cluster."""
+        if len(token) not in self._lengths or not token.isascii():
+            return None
+        body, checksum = token[:-CHECKSUM_LENGTH - 1], token[-CHECKSUM_LENGTH:]
+        if not hmac.compare_digest(checksum, self._checksum(body)):
+            return None
+        # The checksum is valid, so the token was minted by the cluster and has the shard where expected
+        return int(body[len(self.prefix) + 1:len(self.prefix) + 1 + SHARD_LENGTH], 16)
+
+
+class HashRing:
+    """Consistent hash ring assigning the shards to the nodes, each node placed at `replicas` points."""
+
+    def __init__(self, nodes: Iterable[str] = (), shards: int = 256, replicas: int = 64):
+        if not 0 < shards <= MAX_SHARDS:
+            raise ValueError(f"The number of shards must be between 1 and {MAX_SHARDS}")
+        self.shards = shards
+        self.replicas = replicas
+        self._points: list[tuple[int, str]] = []
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> set[str]:
+        return {node for _, node in self._points}
+
+    def add_node(self, node: str) -> None:
+        if node in self.nodes:
+            raise ValueError(f"Node already in the ring: {node}")
+        for i in range(self.replicas):
+            bisect.insort(self._points, (_hash(f"{node}#{i}"), node))
+
+    def remove_node(self, node: str) -> None:
+        self._points = [point for point in self._points if point[1] != node]
+
+    def owner(self, shard: int) -> str:
+        """Node owning a shard: the first one clockwise from the shard position."""
+        if not self._points:
+            raise ValueError("Empty hash ring")
+        i = bisect.bisect(self._points, (_hash(f"shard#{shard}"),))
+        return self._points[i % len(self._points)][1]
+
+    def assignments(self) -> dict[int, str]:
+        return {shard: self.owner(shard) for shard in range(self.shards)}
+
+
+class MigratingStore(OAuthStore):
+    """
+    Store of a shard moving from one node to another, while the move is running.
+
+    Reads fall back to the previous owner, writes go to the new one and
+    deletions apply to both, so an entry is found wherever the move left it and
+    one consumed or revoked meanwhile does not come back.
+    """
+
+    def __init__(self, previous: OAuthStore, current: OAuthStore):
+        self.previous = previous
+        self.current = current
+
+    async def get(self, table: str, key: str) -> Any | None:
+        value = await self.current.get(table, key)
+        return value if value is not None else await self.previous.get(table, key)
+
+    async def get_many(self, table: str, keys: Sequence[str]) -> list[Any | None]:
+        return [await self.get(table, key) for key in keys]
+
+    async def set(self, table: str, key: str, value: Any, ttl: float | None = None) -> None:
+        await self.current.set(table, key, value, ttl=ttl)
+
+    async def delete(self, table: str, key: str) -> bool:
+        deleted = await self.current.delete(table, key)
+        return await self.previous.delete(table, key) or deleted
+
+    async def pop(self, table: str, key: str) -> Any | None:
+        value = await self.current.pop(table, key)
+        previous_value = await self.previous.pop(table, key)
+        return value if value is not None else previous_value
+
+    async def keys(self, table: str) -> list[str]:
+        return list(dict.fromkeys([*await self.current.keys(table), *await self.previous.keys(table)]))
+
+
+class ShardRouter:
+    """
+    Routes the codes and tokens of a node to the store of the node owning their shard.
+
+    stores maps every node of the ring (this one included) to its store: its
+    MemoryStore for in-process nodes, or a client of its own Redis otherwise.
+    """
+
+    def __init__(self, node_id: str, codec: ShardedTokenCodec, ring: HashRing, stores: dict[str, OAuthStore]):
+        self.node_id = node_id
+        self.codec = codec
+        self._rebalance_lock = asyncio.Lock()
+        # Assignments and stores of the ring being switched to, while rebalancing
+        self._migration: tuple[dict[int, str], dict[str, OAuthStore]] | None = None
+        self._apply(ring, stores)
+
+    def _apply(self, ring: HashRing, stores: dict[str, OAuthStore]) -> None:
+        if missing := ring.nodes - stores.keys():
+            raise ValueError(f"No store for the nodes: {', '.join(sorted(missing))}")
+        self.ring, self.stores = ring, stores
+        self._assignments = ring.assignments()
+        self._local_shards = [shard for shard, node in self._assignments.items() if node == self.node_id]
+
+    def mint(self, size: int) -> str:
+        """Mint a code or token on one of the shards of this node (any shard if it owns none)."""
+        shard = random.choice(self._local_shards) if self._local_shards else random.randrange(self.ring.shards)
+        return self.codec.mint(shard, size)
+
+    def owner(self, token: str) -> str | None:
+        """Node owning a code or token, or None if it is malformed."""
+        shard = self.codec.parse(token)
+        if shard is None or shard >= self.ring.shards:
+            return None
+        return self._assignments[shard]
+
+    def store_for(self, token: str) -> OAuthStore | None:
+        """Store of the node owning a code or token, or None if it is malformed."""
+        shard = self.codec.parse(token)
+        if shard is None or shard >= self.ring.shards:
+            return None
+        owner = self._assignments[shard]
+        if self._migration:
+            new_assignments, new_stores = self._migration
+            if (new_owner := new_assignments[shard]) != owner:
+                return MigratingStore(self.stores[owner], new_stores[new_owner])
+        return self.stores[owner]
+
+    async def rebalance(self, ring: HashRing, stores: dict[str, OAuthStore]) -> int:
+        """
+        Switch to a new ring, moving the codes and tokens of this node whose shard
+        changed owner to the store of the new one. Every node has to rebalance,
+        including the ones leaving the ring, which move all their entries away.
+        The registered clients, replicated on all the nodes, are copied to the
+        nodes joining the ring.
+
+        The node keeps serving meanwhile: the moving shards are routed through a
+        MigratingStore and new codes and tokens are only minted on the shards it
+        keeps. Entries written on a moving shard by nodes still on the previous
+        ring are moved by a last scan, after the switch. If the rebalance fails
+        midway, the entries already moved are reachable again once it is retried.
+
+        Returns the number of codes and tokens moved.
+        """
+        if ring.shards != self.ring.shards:
+            raise ValueError("The number of shards cannot change, the issued codes and tokens embed their shard")
+        if missing := ring.nodes - stores.keys():
+            raise ValueError(f"No store for the nodes: {', '.join(sorted(missing))}")
+
+        async with self._rebalance_lock:
+            new_assignments = ring.assignments()
+            previous_local_shards = self._local_shards
+            self._migration = (new_assignments, stores)
+            self._local_shards = [shard for shard, node in new_assignments.items() if node == self.node_id]
+            try:
+                await self._copy_clients(ring, stores)
+                moved = await self._move_entries(new_assignments, stores)
+            except BaseException:
+                self._local_shards = previous_local_shards
+                raise
+            finally:
+                self._migration = None
+            self._apply(ring, stores)
+            try:
+                moved += await self._move_entries(new_assignments, stores)
+            except Exception as e:
+                # Switched already, the next rebalance moves what is left
+                logger.error(f"Node {self.node_id} failed to move the entries written during the rebalance: {e}")
+        logger.info(f"Node {self.node_id} rebalanced to nodes {sorted(ring.nodes)}, moved {moved} codes/tokens")
+        return moved
+
+    async def _copy_clients(self, ring: HashRing, stores: dict[str, OAuthStore]) -> None:
+        if not (new_nodes := ring.nodes - self.ring.nodes):
+            return
+        local_store = self.stores[self.node_id]
+        keys = await local_store.keys(CLIENTS)
+        now = time()
+        for key, client in zip(keys, await local_store.get_many(CLIENTS, keys), strict=True):
+            if client:
+                ttl = client.client_secret_expires_at - now if client.client_secret_expires_at else None
+                for node in new_nodes:
+                    await stores[node].set(CLIENTS, key, client, ttl=ttl)
+
+    async def _move_entries(self, new_assignments: dict[int, str], stores: dict[str, OAuthStore]) -> int:
+        """Move the local codes and tokens on shards owned by another node in the new assignments."""
+        local_store = self.stores[self.node_id]
+        moved = 0
+        for table in (AUTH_CODES, TOKENS):
+            moves = []
+            for key in await local_store.keys(table):
+                shard = self.codec.parse(key)
+                if shard is not None and new_assignments.get(shard, self.node_id) != self.node_id:
+                    moves.append(key)
+            if not moves:
+                continue
+
+            values = await local_store.get_many(table, moves)
+            user_data = await local_store.get_many(USER_DATA, moves) if table == TOKENS else [None] * len(moves)
+            now = time()
+            for key, value, data in zip(moves, values, user_data, strict=True):
+                target = stores[new_assignments[self.codec.parse(key)]]
+                ttl = value.expires_at - now if value and value.expires_at else None
+                if value is None or (ttl is not None and ttl <= 0):
+                    await local_store.delete(table, key)
+                    await local_store.delete(USER_DATA, key)
+                    continue
+                # Copy, then consume the local entry: if it was consumed or revoked
+                # meanwhile, the copy is dropped so it cannot be used again
+                await target.set(table, key, value, ttl=ttl)
+                if data is not None:
+                    await target.set(USER_DATA, key, data, ttl=ttl)
+                if await local_store.pop(table, key) is None:
+                    await target.delete(table, key)
+                    await target.delete(USER_DATA, key)
+                    continue
+                await local_store.delete(USER_DATA, key)
+                moved += 1
+        return moved
@@ -0,0 +1,380 @@
+"""
+Soak test harness, driving long runs of mixed OAuth flows against the in-process app.
+
+The mix covers complete flows along with abandoned authorizations and consents,
+denied consents, expired and revoked tokens and repeat client registrations.
+While it runs, the size of every provider table and tracemalloc snapshots are
+taken periodically. The run fails if, once warmed up, any table grows beyond the
+configured bound; the report shows the top allocation sites since the warmup.
+
+Run it with `python -m authentic.soak --flows 1000000`.
+"""
+
+import asyncio
+import base64
+import hashlib
+import itertools
+import random
+import secrets
+import sys
+import tracemalloc
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.logger import configure_logger
+from authentic.oauth_provider import SimpleOAuthProvider
+from authentic.oauth_server import build_oauth2_server
+from authentic.store import MemoryStore
+from authentic.store.base import TABLES
+
+BASE_URL = "http://localhost:9000"
+REDIRECT_URI = "http://localhost:3000/callback"
+
+# Relative weights of the flows in the mix
+FLOW_WEIGHTS = {
+    "complete": 40,
+    "abandoned_authorization": 10,
+    "abandoned_consent": 10,
+    "denied_consent": 10,
+    "expired_token": 10,
+    "revoked_token": 10,
+    "registration": 10,
+}
+
+
+def deep_sizeof(obj: Any, seen: set[int] | None = None) -> int:
+    """Approximate size in bytes of an object and everything it references."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, list | tuple | set | frozenset):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+@dataclass
+class TableUsage:
+    entries: int
+    bytes: int
+
+
+def measure_tables(store: MemoryStore) -> dict[str, TableUsage]:
+    """Entries and retained bytes of every table (including the deadlines of their entries)."""
+    return {
+        table: TableUsage(
+            len(store.tables[table]),
+            deep_sizeof(store.tables[table]) + deep_sizeof(store.deadlines[table]) + deep_sizeof(store.expiry_heaps[table]),
+        )
+        for table in TABLES
+    }
+
+
+@dataclass
+class SoakReport:
+    flows: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    baseline: dict[str, TableUsage] = field(default_factory=dict)
+    # Table usage at every snapshot, since the start of the run
+    samples: list[dict[str, TableUsage]] = field(default_factory=list)
+    # Max growth in bytes of every table over the baseline
+    growth: dict[str, int] = field(default_factory=dict)
+    traced_growth: int = 0
+    top_sites: list[str] = field(default_factory=list)
+    failures: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+
+class SoakRunner:
+    """Drives the flows against an app built by build_oauth2_server, through an in-process transport."""
+
+    def __init__(self, auth_settings: SimpleAuthSettings, auth_server_settings: AuthServerSettings, seed: int | None = None, clients: int = 8):
+        self.auth_settings = auth_settings
+        configure_logger(auth_server_settings.log_level)
+        self.app = build_oauth2_server(auth_settings, auth_server_settings)
+        self.provider: SimpleOAuthProvider = self.app.state.oauth_provider
+        assert isinstance(self.provider.store, MemoryStore), "The soak test measures the in-memory store"
+        self.store = self.provider.store
+        self.random = random.Random(seed)
+        self.pool_size = clients
+        # Registered clients (with their registration time) the flows pick from
+        self.clients: list[tuple[dict, float]] = []
+        # Issued tokens (with their issue time) left to expire, for the expired token flows
+        self.stale_tokens: deque[tuple[str, float]] = deque(maxlen=1000)
+        self.http: httpx.AsyncClient | None = None
+
+    async def run(self, flows: int, concurrency: int = 16, snapshot_every: int = 10_000, warmup: float | None = None, max_table_growth: int = 1 << 20, top: int = 10) -> SoakReport:
+        """Run the flows and check the table growth once the run has warmed up (by default, after the longest ttl)."""
+        report = SoakReport()
+        settings = self.auth_settings
+        longest_ttl = max(settings.auth_code_expiry, settings.access_token_expiry, settings.flow_expiry, settings.client_secret_expiry or 0)
+        if warmup is None:
+            warmup = 2 * longest_ttl + self.store.sweep_interval
+
+        started = monotonic()
+        counter = itertools.count()
+        baseline_snapshot: tracemalloc.Snapshot | None = None
+        last_snapshot: tracemalloc.Snapshot | None = None
+
+        def take_snapshot() -> None:
+            nonlocal baseline_snapshot, last_snapshot
+            usage = measure_tables(self.store)
+            report.samples.append(usage)
+            last_snapshot = tracemalloc.take_snapshot()
+            if baseline_snapshot is None:
+                if monotonic() - started < warmup:
+                    return
+                baseline_snapshot, report.baseline = last_snapshot, usage
+            for table in TABLES:
+                growth = usage[table].bytes - report.baseline[table].bytes
+                report.growth[table] = max(report.growth.get(table, growth), growth)
+
+        async def worker() -> None:
+            while (i := next(counter)) < flows:
+                flow = self.random.choices(list(FLOW_WEIGHTS), weights=list(FLOW_WEIGHTS.values()))[0]
+                try:
+                    flow = await getattr(self, f"_{flow}")()
+                    report.flows[flow] += 1
+                except (AssertionError, httpx.HTTPError, KeyError) as e:
+                    report.errors[f"{flow}: {type(e).__name__}: {e}"] += 1
+                if (i + 1) % snapshot_every == 0:
+                    take_snapshot()
+
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            async with self.app.router.lifespan_context(self.app):
+                transport = httpx.ASGITransport(app=self.app)
+                async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as self.http:
+                    await asyncio.gather(*(worker() for _ in range(concurrency)))
+            report.elapsed = monotonic() - started
+            if baseline_snapshot is None:
+                report.failures.append("The run ended before warming up, use more flows or a shorter warmup")
+                return report
+
+            # Let everything issued during the run expire, so the last sample shows what is left behind
+            await asyncio.sleep(longest_ttl + 1)
+            self.store.sweep()
+            take_snapshot()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        stats = [
+            stat for stat in last_snapshot.compare_to(baseline_snapshot, "lineno")
+            if not stat.traceback[0].filename.endswith(("tracemalloc.py", "<frozen importlib._bootstrap>"))
+        ]
+        report.traced_growth = sum(stat.size_diff for stat in stats)
+        report.top_sites = [str(stat) for stat in stats[:top]]
+        report.failures += [
+            f"Table {table} grew {growth} bytes (bound {max_table_growth})"
+            for table, growth in report.growth.items()
+            if growth > max_table_growth
+        ]
+        if report.errors:
+            report.failures.append(f"{sum(report.errors.values())} flows did not behave as expected")
+        return report
+
+    #########################################################
+    # Flows
+    #########################################################
+
+    async def _client(self) -> dict:
+        """Pick a registered client, registering one if the pool is not full or the picked one is about to expire."""
+        expiry = self.auth_settings.client_secret_expiry
+        if len(self.clients) < self.pool_size:
+            return await self._register()
+        index = self.random.randrange(len(self.clients))
+        client, registered_at = self.clients[index]
+        if expiry and monotonic() - registered_at > expiry / 2:
+            return await self._register(index)
+        return client
+
+    async def _register(self, index: int | None = None) -> dict:
+        response = await self.http.post("/register", json={"redirect_uris": [REDIRECT_URI], "scope": self.auth_settings.mcp_scope})
+        assert response.status_code == 201, response.text
+        client = response.json()
+        if index is None and len(self.clients) < self.pool_size:
+            self.clients.append((client, monotonic()))
+        else:
+            self.clients[self.random.randrange(len(self.clients)) if index is None else index] = (client, monotonic())
+        return client
+
+    async def _authorize(self) -> tuple[dict, str, str]:
+        """Start an authorization, returning the client, state and PKCE verifier."""
+        client = await self._client()
+        state = secrets.token_hex(16)
+        verifier = secrets.token_urlsafe(48)
+        challenge = base64.urlsafe_b64encode(hashlib.sha256(verifier.encode()).digest()).decode().rstrip("=")
+        response = await self.http.get("/authorize", params={
+            "response_type": "code",
+            "client_id": client["client_id"],
+            "redirect_uri": REDIRECT_URI,
+            "code_challenge": challenge,
+            "code_challenge_method": "S256",
+            "state": state,
+        })
+        assert response.status_code == 302, response.text
+        return client, state, verifier
+
+    async def _login(self, state: str) -> str:
+        """Log in for an authorization, returning the consent token."""
+        response = await self.http.post("/login/callback", data={
+            "username": self.auth_settings.username,
+            "password": self.auth_settings.password,
+            "state": state,
+        })
+        assert response.status_code == 302, response.text
+        return parse_qs(urlparse(response.headers["location"]).query)["token"][0]
+
+    async def _introspect(self, token: str) -> bool:
+        response = await self.http.post("/introspect", data={"token": token})
+        assert response.status_code == 200, response.text
+        return response.json()["active"]
+
+    async def _issue_token(self) -> str:
+        """Go through a whole flow, returning the (introspected) access token."""
+        client, state, verifier = await self._authorize()
+        consent_token = await self._login(state)
+        response = await self.http.post("/consent/callback", data={"consent_token": consent_token, "action": "approve"})
+        assert response.status_code == 302, response.text
+        code = parse_qs(urlparse(response.headers["location"]).query)["code"][0]
+
+        response = await self.http.post("/token", data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": REDIRECT_URI,
+            "client_id": client["client_id"],
+            "client_secret": client["client_secret"],
+            "code_verifier": verifier,
+        })
+        assert response.status_code == 200, response.text
+        token = response.json()["access_token"]
+        assert await self._introspect(token)
+        return token
+
+    async def _complete(self) -> str:
+        self.stale_tokens.append((await self._issue_token(), monotonic()))
+        return "complete"
+
+    async def _abandoned_authorization(self) -> str:
+        await self._authorize()
+        return "abandoned_authorization"
+
+    async def _abandoned_consent(self) -> str:
+        _, state, _ = await self._authorize()
+        await self._login(state)
+        return "abandoned_consent"
+
+    async def _denied_consent(self) -> str:
+        _, state, _ = await self._authorize()
+        consent_token = await self._login(state)
+        response = await self.http.post("/consent/callback", data={"consent_token": consent_token, "action": "deny"})
+        assert response.status_code == 403, response.text
+        return "denied_consent"
+
+    async def _expired_token(self) -> str:
+        # Only tokens old enough are known to have expired, until there are some run a complete flow
+        if not self.stale_tokens or monotonic() - self.stale_tokens[0][1] <= self.auth_settings.access_token_expiry + 1:
+            return await self._complete()
+        token, _ = self.stale_tokens.popleft()
+        assert not await self._introspect(token)
+        return "expired_token"
+
+    async def _revoked_token(self) -> str:
+        token = await self._issue_token()
+        # The revocation endpoint is not enabled, revoke through the provider
+        await self.provider.revoke_token(await self.provider.load_access_token(token))
+        assert not await self._introspect(token)
+        return "revoked_token"
+
+    async def _registration(self) -> str:
+        await self._register()
+        return "registration"
+
+
+def print_report(report: SoakReport, console: Console) -> None:
+    flows = sum(report.flows.values())
+    console.print(f"{flows} flows in {report.elapsed:.1f}s ({flows / max(report.elapsed, 1e-9):.0f} flows/s): {dict(report.flows)}")
+    for error, count in report.errors.most_common(10):
+        console.print(f"[red]{count} x {error}[/red]")
+
+    if report.samples:
+        table = Table(title="Provider tables")
+        table.add_column("Table")
+        table.add_column("Baseline", justify="right")
+        table.add_column("Final", justify="right")
+        table.add_column("Max growth", justify="right")
+        for name in TABLES:
+            baseline = report.baseline.get(name)
+            final = report.samples[-1][name]
+            table.add_row(
+                name,
+                f"{baseline.entries} / {baseline.bytes} B" if baseline else "-",
+                f"{final.entries} / {final.bytes} B",
+                f"{report.growth[name]} B" if name in report.growth else "-",
+            )
+        console.print(table)
+
+    console.print(f"Traced memory growth since the warmup: {report.traced_growth} B")
+    console.print("Top allocation sites:")
+    for site in report.top_sites:
+        console.print(f"  {site}")
+
+    for failure in report.failures:
+        console.print(f"[red]FAILED: {failure}[/red]")
+    if report.passed:
+        console.print("[green]PASSED[/green]")
+
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    flows: int = typer.Option(1_000_000, help="Number of flows to run"),
+    concurrency: int = typer.Option(16, help="Flows running concurrently"),
+    snapshot_every: int = typer.Option(10_000, help="Flows between memory snapshots"),
+    max_table_growth: int = typer.Option(1 << 20, help="Max growth in bytes of any table over the warmed up baseline"),
+    warmup: float | None = typer.Option(None, help="Seconds before taking the baseline, by default twice the longest ttl"),
+    ttl: int = typer.Option(2, help="Lifetime in seconds of codes, tokens, pending flows (and half the clients')"),
+    top: int = typer.Option(10, help="Number of allocation sites to report"),
+    seed: int | None = typer.Option(None, help="Seed of the flow mix"),
+    log_level: str = typer.Option("ERROR", help="Log level of the server"),
+) -> None:
+    auth_settings = SimpleAuthSettings(
+        auth_code_expiry=ttl,
+        access_token_expiry=ttl,
+        flow_expiry=ttl,
+        client_secret_expiry=2 * ttl,
+        _env_file=None,
+    )
+    auth_server_settings = AuthServerSettings(auth_host="localhost", log_level=log_level, _env_file=None)
+
+    runner = SoakRunner(auth_settings, auth_server_settings, seed=seed)
+    report = asyncio.run(runner.run(flows, concurrency, snapshot_every, warmup, max_table_growth, top))
+    print_report(report, Console())
+    raise typer.Exit(0 if report.passed else 1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,18 @@
+"""Storage backends for the OAuth provider state."""
+
+from authentic.store.base import OAuthStore
+from authentic.store.memory import MemoryStore
+
+
+def create_store(url: str | None = None, pool_size: int = 10) -> OAuthStore:
+    """Create the store for the given url: in-memory if unset, Redis for redis:// urls."""
+    if not url:
+        return MemoryStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from authentic.store.redis_store import RedisStore
+
+        return RedisStore(url, pool_size=pool_size)
+    raise ValueError(f"Unsupported store url: {url}")
+
+
+__all__ = ["OAuthStore", "MemoryStore", "create_store"]
@@ -0,0 +1,51 @@
+"""Storage interface for the OAuth provider state."""
+
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Any
+
+# Tables holding the provider state
+CLIENTS = "clients"
+AUTH_CODES = "auth_codes"
+TOKENS = "tokens"
+STATE_MAPPING = "state_mapping"
+USER_DATA = "user_data"
+PENDING_CONSENT = "pending_consent"
+
+TABLES = (CLIENTS, AUTH_CODES, TOKENS, STATE_MAPPING, USER_DATA, PENDING_CONSENT)
+
+
+class OAuthStore(ABC):
+    """
+    Key/value store for the provider state, split in the named TABLES.
+
+    Entries stored with a ttl (in seconds) expire on their own once it elapses.
+    """
+
+    @abstractmethod
+    async def get(self, table: str, key: str) -> Any | None:
+        """Get an entry, or None if it does not exist or has expired."""
+
+    @abstractmethod
+    async def get_many(self, table: str, keys: Sequence[str]) -> list[Any | None]:
+        """Get several entries of a table at once, in the order of the keys."""
+
+    @abstractmethod
+    async def set(self, table: str, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store an entry, replacing any previous one."""
+
+    @abstractmethod
+    async def delete(self, table: str, key: str) -> bool:
+        """Delete an entry, returning whether it existed."""
+
+    @abstractmethod
+    async def pop(self, table: str, key: str) -> Any | None:
+        """Atomically get and delete an entry, so only one caller can consume it."""
+
+    @abstractmethod
+    async def keys(self, table: str) -> list[str]:
+        """Get the keys of a table (possibly including some expired ones)."""
+
+    async def close(self) -> None:
+        """Release the resources held by the store, nothing by default."""
+        return None
@@ -0,0 +1,83 @@
+"""In-process store, the default when no shared store is configured."""
+
+import heapq
+from collections.abc import Sequence
+from time import monotonic
+from typing import Any
+
+from authentic.store.base import TABLES, OAuthStore
+
+
+class MemoryStore(OAuthStore):
+    """
+    Store keeping the provider state in plain dicts, one per table.
+
+    Expired entries are dropped when accessed and, so that the ones never accessed
+    again (abandoned flows, unused codes and tokens) don't pile up, by a sweep run
+    from set() at most every sweep_interval seconds. The sweep pops the deadlines
+    due from a heap per table, so it only costs the entries expired since the
+    previous one, whatever the number of live entries.
+    """
+
+    def __init__(self, sweep_interval: float = 1.0):
+        self.tables: dict[str, dict[str, Any]] = {table: {} for table in TABLES}
+        # Monotonic deadlines of the entries stored with a ttl
+        self.deadlines: dict[str, dict[str, float]] = {table: {} for table in TABLES}
+        # Heaps of (deadline, key), the ones no longer in deadlines (entry deleted or set again) are skipped
+        self.expiry_heaps: dict[str, list[tuple[float, str]]] = {table: [] for table in TABLES}
+        self.sweep_interval = sweep_interval
+        self._next_sweep = monotonic() + sweep_interval
+
+    def sweep(self) -> int:
+        """Drop all the expired entries, returning how many."""
+        now = monotonic()
+        swept = 0
+        for table, heap in self.expiry_heaps.items():
+            deadlines = self.deadlines[table]
+            while heap and heap[0][0] <= now:
+                deadline, key = heapq.heappop(heap)
+                if deadlines.get(key) == deadline:
+                    self.tables[table].pop(key, None)
+                    del deadlines[key]
+                    swept += 1
+        self._next_sweep = now + self.sweep_interval
+        return swept
+
+    def _expired(self, table: str, key: str) -> bool:
+        deadline = self.deadlines[table].get(key)
+        if deadline is None or deadline > monotonic():
+            return False
+        self.tables[table].pop(key, None)
+        del self.deadlines[table][key]
+        return True
+
+    async def get(self, table: str, key: str) -> Any | None:
+        if self._expired(table, key):
+            return None
+        return self.tables[table].get(key)
+
+    async def get_many(self, table: str, keys: Sequence[str]) -> list[Any | None]:
+        return [await self.get(table, key) for key in keys]
+
+    async def set(self, table: str, key: str, value: Any, ttl: float | None = None) -> None:
+        if monotonic() >= self._next_sweep:
+            self.sweep()
+        self.tables[table][key] = value
+        if ttl is None:
+            self.deadlines[table].pop(key, None)
+        else:
+            deadline = monotonic() + ttl
+            self.deadlines[table][key] = deadline
+            heapq.heappush(self.expiry_heaps[table], (deadline, key))
+
+    async def delete(self, table: str, key: str) -> bool:
+        return await self.pop(table, key) is not None
+
+    async def pop(self, table: str, key: str) -> Any | None:
+        if self._expired(table, key):
+            return None
+        self.deadlines[table].pop(key, None)
+        return self.tables[table].pop(key, None)
+
+    async def keys(self, table: str) -> list[str]:
+        return list(self.tables[table])
@@ -0,0 +1,86 @@
+"""Shared store speaking the Redis protocol, for running several instances together."""
+
+import json
+from collections.abc import Sequence
+from typing import Any
+
+from mcp.server.auth.provider import AccessToken, AuthorizationCode
+from mcp.shared.auth import OAuthClientInformationFull
+from pydantic import BaseModel
+
+from authentic.store.base import AUTH_CODES, CLIENTS, TOKENS, OAuthStore
+
+# Tables holding models, the rest hold JSON-serializable dicts
+MODELS: dict[str, type[BaseModel]] = {
+    CLIENTS: OAuthClientInformationFull,
+    AUTH_CODES: AuthorizationCode,
+    TOKENS: AccessToken,
+}
+
+
+class RedisStore(OAuthStore):
+    """
+    Store keeping the provider state in a Redis (or protocol compatible) server.
+
+    Every entry is a plain string key `<prefix>:<table>:<key>`, so ttls map to
+    native key expiry, single-use entries are consumed with GETDEL and batch
+    lookups are pipelined in a single round trip. Connections come from a
+    bounded pool shared by all the requests.
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, prefix: str = "authentic"):
+        try:
+            from redis.asyncio import BlockingConnectionPool, Redis
+        except ImportError as e:
+            raise ImportError("The Redis store requires the redis package: pip install 'authentic[redis]'") from e
+
+        self.prefix = prefix
+        # RESP2 is spoken by every Redis compatible server, the url can still ask for ?protocol=3
+        self.pool = BlockingConnectionPool.from_url(url, max_connections=pool_size, protocol=2)
+        self.redis = Redis(connection_pool=self.pool)
+
+    def _key(self, table: str, key: str) -> str:
+        return f"{self.prefix}:{table}:{key}"
+
+    @staticmethod
+    def _dumps(table: str, value: Any) -> str:
+        if table in MODELS:
+            return value.model_dump_json()
+        return json.dumps(value)
+
+    @staticmethod
+    def _loads(table: str, data: bytes | None) -> Any | None:
+        if data is None:
+            return None
+        if table in MODELS:
+            return MODELS[table].model_validate_json(data)
+        return json.loads(data)
+
+    async def get(self, table: str, key: str) -> Any | None:
+        return self._loads(table, await self.redis.get(self._key(table, key)))
+
+    async def get_many(self, table: str, keys: Sequence[str]) -> list[Any | None]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.get(self._key(table, key))
+            results = await pipe.execute()
+        return [self._loads(table, data) for data in results]
+
+    async def set(self, table: str, key: str, value: Any, ttl: float | None = None) -> None:
+        # Millisecond precision, but never a zero/negative ttl which Redis rejects
+        px = max(1, int(ttl * 1000)) if ttl is not None else None
+        await self.redis.set(self._key(table, key), self._dumps(table, value), px=px)
+
+    async def delete(self, table: str, key: str) -> bool:
+        return await self.redis.delete(self._key(table, key)) == 1
+
+    async def pop(self, table: str, key: str) -> Any | None:
+        return self._loads(table, await self.redis.getdel(self._key(table, key)))
+
+    async def keys(self, table: str) -> list[str]:
+        prefix = self._key(table, "")
+        return [key.decode()[len(prefix):] async for key in self.redis.scan_iter(match=f"{prefix}*", count=1000)]
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+        await self.pool.disconnect()
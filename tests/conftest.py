@@ -0,0 +1,14 @@
+"""Fixtures shared by the tests."""
+
+import pytest
+
+from authentic import logger as logger_config
+from authentic.logger import configure_logger
+
+
+@pytest.fixture
+def restore_log_level():
+    """Restore the global log level changed by reloading the server."""
+    log_level = logger_config._current_log_level
+    yield
+    configure_logger(log_level)
@@ -0,0 +1,41 @@
+"""Helpers driving the OAuth flow through the app routes."""
+
+import base64
+import hashlib
+import secrets
+from urllib.parse import parse_qs, urlparse
+
+from starlette.testclient import TestClient
+
+REDIRECT_URI = "http://localhost:3000/callback"
+
+
+def authorize(client: TestClient) -> tuple[dict, str, str]:
+    """Register a client and go through login and consent, returning the client, code and verifier."""
+    registered = client.post("/register", json={"redirect_uris": [REDIRECT_URI], "scope": "user"}).json()
+    verifier = secrets.token_urlsafe(48)
+    challenge = base64.urlsafe_b64encode(hashlib.sha256(verifier.encode()).digest()).decode().rstrip("=")
+    client.get("/authorize", params={
+        "response_type": "code",
+        "client_id": registered["client_id"],
+        "redirect_uri": REDIRECT_URI,
+        "code_challenge": challenge,
+        "code_challenge_method": "S256",
+        "state": "state",
+    }, follow_redirects=False)
+    consent = client.post("/login/callback", data={"username": "fps", "password": "fps", "state": "state"}, follow_redirects=False)
+    consent_token = parse_qs(urlparse(consent.headers["location"]).query)["token"][0]
+    callback = client.post("/consent/callback", data={"consent_token": consent_token, "action": "approve"}, follow_redirects=False)
+    code = parse_qs(urlparse(callback.headers["location"]).query)["code"][0]
+    return registered, code, verifier
+
+
+def exchange(client: TestClient, registered: dict, code: str, verifier: str):
+    return client.post("/token", data={
+        "grant_type": "authorization_code",
+        "code": code,
+        "redirect_uri": REDIRECT_URI,
+        "client_id": registered["client_id"],
+        "client_secret": registered["client_secret"],
+        "code_verifier": verifier,
+    })
@@ -0,0 +1,151 @@
+"""In-process stand-in for a Redis server, covering the commands used by the store."""
+
+import asyncio
+import fnmatch
+import threading
+from time import monotonic
+
+
+class RespServer:
+    """
+    Minimal RESP2 server keeping string keys (with optional expiry) in a dict.
+
+    It runs its own event loop in a background thread, so clients in any loop
+    (e.g. the ones of several Starlette test clients) can connect to it.
+    """
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.commands: list[bytes] = []
+        # Reads of the client sockets, one per round trip (a pipeline arrives in a single one)
+        self.reads = 0
+        self.connections = 0
+        self._writers: set[asyncio.StreamWriter] = set()
+        self.port = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server: asyncio.Server | None = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def start(self) -> "RespServer":
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0), self._loop
+        ).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self) -> None:
+        async def close():
+            self._server.close()
+            # Clients left open (e.g. by a failed test) would keep wait_closed() waiting
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _get(self, key: bytes) -> bytes | None:
+        value, deadline = self.data.get(key, (None, None))
+        if deadline is not None and deadline <= monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def ttl_ms(self, key: str) -> int:
+        """Remaining ttl of a key in ms, -1 without expiry and -2 if missing (like PTTL)."""
+        if self._get(key.encode()) is None:
+            return -2
+        deadline = self.data[key.encode()][1]
+        return -1 if deadline is None else int((deadline - monotonic()) * 1000)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        buffer = b""
+        try:
+            while data := await reader.read(65536):
+                self.reads += 1
+                buffer += data
+                # Answer all the complete commands received, in a single write
+                replies = []
+                while parsed := _parse_command(buffer):
+                    args, buffer = parsed
+                    self.commands.append(args[0].upper())
+                    replies.append(self._execute(args[0].upper(), args[1:]))
+                if replies:
+                    writer.write(b"".join(replies))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _execute(self, command: bytes, args: list[bytes]) -> bytes:
+        match command:
+            case b"PING":
+                return b"+PONG\r\n"
+            case b"CLIENT" | b"SELECT":
+                return b"+OK\r\n"
+            case b"GET":
+                return _bulk(self._get(args[0]))
+            case b"GETDEL":
+                value = self._get(args[0])
+                self.data.pop(args[0], None)
+                return _bulk(value)
+            case b"SET":
+                deadline = None
+                options = [arg.upper() for arg in args[2:]]
+                if b"PX" in options:
+                    deadline = monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    deadline = monotonic() + int(options[options.index(b"EX") + 1])
+                self.data[args[0]] = (args[1], deadline)
+                return b"+OK\r\n"
+            case b"DEL":
+                deleted = sum(self._get(key) is not None and self.data.pop(key) is not None for key in args)
+                return b":%d\r\n" % deleted
+            case b"SCAN":
+                # The cursor is an offset in the sorted live keys, MATCH filters each page like Redis does
+                options = [arg.upper() for arg in args[1:]]
+                count = int(args[1:][options.index(b"COUNT") + 1]) if b"COUNT" in options else 10
+                pattern = args[1:][options.index(b"MATCH") + 1] if b"MATCH" in options else b"*"
+                keys = sorted(key for key in list(self.data) if self._get(key) is not None)
+                start = int(args[0])
+                page = [key for key in keys[start:start + count] if fnmatch.fnmatchcase(key, pattern)]
+                cursor = start + count if start + count < len(keys) else 0
+                return b"*2\r\n" + _bulk(b"%d" % cursor) + b"*%d\r\n" % len(page) + b"".join(_bulk(key) for key in page)
+            case _:
+                return b"-ERR unknown command '%s'\r\n" % command
+
+
+def _parse_command(buffer: bytes) -> tuple[list[bytes], bytes] | None:
+    """Parse the first command of the buffer, returning it with the rest, or None if incomplete."""
+    end = buffer.find(b"\r\n")
+    if end < 0:
+        return None
+    assert buffer.startswith(b"*"), buffer
+    args = []
+    position = end + 2
+    for _ in range(int(buffer[1:end])):
+        end = buffer.find(b"\r\n", position)
+        if end < 0:
+            return None
+        length = int(buffer[position + 1:end])
+        if len(buffer) < end + 2 + length + 2:
+            return None
+        args.append(buffer[end + 2:end + 2 + length])
+        position = end + 2 + length + 2
+    return args, buffer[position:]
+
+
+def _bulk(value: bytes | None) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
@@ -0,0 +1,159 @@
+"""Tests for the audit log."""
+
+import asyncio
+import json
+from pathlib import Path
+
+from starlette.testclient import TestClient
+
+from authentic.audit import AuditLog, RotatingJsonLinesWriter, fingerprint
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.oauth_server import build_oauth2_server
+from tests.oauth_flow import authorize, exchange
+
+
+def read_events(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_events_are_flushed_in_batches(tmp_path: Path):
+    """Test that events are buffered in memory and written by the background task."""
+    async def scenario():
+        audit = AuditLog(RotatingJsonLinesWriter(tmp_path / "audit.jsonl"), batch_size=2, flush_interval=60)
+        await audit.start()
+        audit.emit("token_revoked", client_id="client")
+        await asyncio.sleep(0.05)
+        assert (tmp_path / "audit.jsonl").read_text() == ""
+
+        # A full batch wakes the flushing task up without waiting for the interval
+        audit.emit("token_revoked", client_id="other")
+        await asyncio.sleep(0.05)
+        assert [e["client_id"] for e in read_events(tmp_path / "audit.jsonl")] == ["client", "other"]
+        await audit.close()
+
+    asyncio.run(scenario())
+
+
+def test_overflow_policies(tmp_path: Path):
+    """Test that a full buffer drops the oldest or newest events and records how many."""
+    async def scenario(policy: str) -> list[dict]:
+        path = tmp_path / f"{policy}.jsonl"
+        audit = AuditLog(RotatingJsonLinesWriter(path), buffer_size=2, overflow=policy)
+        for i in range(5):
+            audit.emit("code_issued", n=i)
+        await audit.close()
+        return read_events(path)
+
+    oldest = asyncio.run(scenario("drop_oldest"))
+    assert [e.get("n") for e in oldest[:2]] == [3, 4]
+    assert oldest[2]["event"] == "audit_events_dropped"
+    assert oldest[2]["count"] == 3
+
+    newest = asyncio.run(scenario("drop_newest"))
+    assert [e.get("n") for e in newest[:2]] == [0, 1]
+    assert newest[2]["count"] == 3
+
+
+def test_failed_batches_are_retried(tmp_path: Path):
+    """Test that a batch failing with any error is kept and written by a later round of the flushing task."""
+    class FlakyWriter(RotatingJsonLinesWriter):
+        failures = 1
+
+        def write_batch(self, records):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("transient failure")
+            super().write_batch(records)
+
+    async def scenario():
+        audit = AuditLog(FlakyWriter(tmp_path / "audit.jsonl"), flush_interval=0.01)
+        await audit.start()
+        audit.emit("token_issued", n=0, expires_at=Path("not-json"))
+        await asyncio.sleep(0.1)
+        assert not audit._task.done()
+        audit.emit("token_issued", n=1)
+        await audit.close()
+
+    asyncio.run(scenario())
+    events = read_events(tmp_path / "audit.jsonl")
+    assert [e["n"] for e in events] == [0, 1]
+    assert events[0]["expires_at"] == "not-json"
+
+
+def test_files_are_rotated(tmp_path: Path):
+    """Test that the log rotates once it exceeds its size, keeping backup_count files."""
+    writer = RotatingJsonLinesWriter(tmp_path / "audit.jsonl", max_bytes=100, backup_count=2)
+    for i in range(4):
+        writer.write_batch([{"event": "token_issued", "n": i, "padding": "x" * 50}])
+    writer.close()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["audit.jsonl", "audit.jsonl.1", "audit.jsonl.2"]
+    assert read_events(tmp_path / "audit.jsonl")[0]["n"] == 3
+    assert read_events(tmp_path / "audit.jsonl.2")[0]["n"] == 1
+
+
+def test_token_lifecycle_is_audited(tmp_path: Path):
+    """Test the events recorded along a flow, without any raw code or token in the log."""
+    path = tmp_path / "audit.jsonl"
+    settings = AuthServerSettings(auth_host="localhost", audit_log_path=str(path), _env_file=None)
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+
+    with TestClient(app) as client:
+        registered, code, verifier = authorize(client)
+        token = exchange(client, registered, code, verifier).json()["access_token"]
+        assert exchange(client, registered, code, verifier).status_code == 400
+        assert exchange(client, registered, "mcp_bogus", verifier).status_code == 400
+        # The revocation endpoint is not enabled, revoke through the provider
+        provider = app.state.oauth_provider
+        client.portal.call(provider.revoke_token, client.portal.call(provider.load_access_token, token))
+        client.post("/introspect", data={"token": token})
+
+    events = read_events(path)
+    assert [e["event"] for e in events] == [
+        "code_issued",
+        "consent_approved",
+        "token_issued",
+        "code_exchange_failed",
+        "code_exchange_failed",
+        "token_revoked",
+        "introspection_failed",
+    ]
+    assert events[0]["client_id"] == events[1]["client_id"] == registered["client_id"]
+    assert events[3]["code"] == fingerprint(code) and events[3]["reason"] == "unknown_code"
+    assert events[4]["code"] == fingerprint("mcp_bogus")
+    assert events[2]["token"] == events[5]["token"] == events[6]["token"] == fingerprint(token)
+    assert code not in path.read_text() and token not in path.read_text()
+
+
+def test_rejected_code_exchanges_are_audited(tmp_path: Path):
+    """Test that the exchanges rejected by the token handler are recorded, with the reason."""
+    path = tmp_path / "audit.jsonl"
+    settings = AuthServerSettings(auth_host="localhost", audit_log_path=str(path), _env_file=None)
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+
+    with TestClient(app) as client:
+        registered, code, verifier = authorize(client)
+        other, _, _ = authorize(client)
+        assert exchange(client, other, code, verifier).status_code == 400
+        assert exchange(client, registered, code, "wrong-verifier").status_code == 400
+        wrong_redirect = client.post("/token", data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": "http://localhost:3000/other",
+            "client_id": registered["client_id"],
+            "client_secret": registered["client_secret"],
+            "code_verifier": verifier,
+        })
+        assert wrong_redirect.status_code == 400
+        assert exchange(client, {**registered, "client_secret": "wrong"}, code, verifier).status_code == 400
+        # None of the failures consumed the code
+        assert exchange(client, registered, code, verifier).status_code == 200
+
+    failures = [e for e in read_events(path) if e["event"] == "code_exchange_failed"]
+    assert [(e["client_id"], e["reason"]) for e in failures] == [
+        (other["client_id"], "client_mismatch"),
+        (registered["client_id"], "pkce_failed"),
+        (registered["client_id"], "redirect_uri_mismatch"),
+        (registered["client_id"], "unauthorized_client"),
+    ]
+    assert all(e["code"] == fingerprint(code) for e in failures)
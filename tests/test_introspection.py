@@ -0,0 +1,114 @@
+"""Tests for the raw ASGI fast path of the introspection endpoint."""
+
+import asyncio
+from time import time
+
+import pytest
+from mcp.server.auth.provider import AccessToken
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from authentic.bench import build_cases, run_bench
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.introspection import IntrospectionEndpoint
+from authentic.oauth_server import build_oauth2_server
+from authentic.sharding import HashRing, ShardedTokenCodec, ShardRouter
+from authentic.store.base import TOKENS
+from tests.oauth_flow import authorize, exchange
+
+ORIGIN = "http://localhost:3000"
+
+
+@pytest.fixture
+def clients() -> tuple[Starlette, TestClient, TestClient]:
+    """The app with the fast path, and clients of it and of the handler it falls back to."""
+    app = build_oauth2_server(
+        SimpleAuthSettings(_env_file=None),
+        AuthServerSettings(auth_host="localhost", log_level="ERROR", _env_file=None),
+    )
+    endpoint = next(route.endpoint for route in app.routes if getattr(route, "path", None) == "/introspect")
+    assert isinstance(endpoint, IntrospectionEndpoint)
+    slow_app = Starlette(routes=[Route("/introspect", endpoint.fallback, methods=["POST", "OPTIONS"])])
+    return app, TestClient(app), TestClient(slow_app)
+
+
+def assert_same(fast, slow) -> None:
+    assert (fast.status_code, dict(fast.headers)) == (slow.status_code, dict(slow.headers))
+    fast_body, slow_body = fast.json(), slow.json()
+    # The issue time may tick between both calls
+    assert abs(fast_body.pop("iat", 0) - slow_body.pop("iat", 0)) <= 1
+    assert fast_body == slow_body
+
+
+def test_introspection_matches_the_handler(clients):
+    """Test that the fast path answers the same as the starlette handler for every kind of token."""
+    app, fast, slow = clients
+    registered, code, verifier = authorize(fast)
+    token = exchange(fast, registered, code, verifier).json()["access_token"]
+    store = app.state.oauth_provider.store
+    store.tables[TOKENS]["spaced token+/é"] = AccessToken(token="spaced token+/é", client_id="client", scopes=["a", "b"])
+
+    for data in ({"token": token}, {"token": "spaced token+/é"}, {"token": "unknown"}, {"token": ""}, {}):
+        for headers in ({}, {"origin": ORIGIN}, {"origin": ORIGIN, "cookie": "session=1"}):
+            assert_same(fast.post("/introspect", data=data, headers=headers), slow.post("/introspect", data=data, headers=headers))
+
+    # Without a content type the form is empty
+    assert_same(fast.post("/introspect", content=f"token={token}"), slow.post("/introspect", content=f"token={token}"))
+    # Multipart bodies go through the handler
+    multipart = fast.post("/introspect", files={"token": (None, token)})
+    assert multipart.json()["active"] is True
+
+
+def test_expired_tokens_are_inactive_and_dropped(clients):
+    """Test that an expired token is reported inactive and removed from the store."""
+    app, fast, _ = clients
+    store = app.state.oauth_provider.store
+    store.tables[TOKENS]["expired"] = AccessToken(token="expired", client_id="client", scopes=[], expires_at=int(time()) - 1)
+
+    assert fast.post("/introspect", data={"token": "expired"}).json() == {"active": False}
+    assert "expired" not in store.tables[TOKENS]
+
+
+def test_malformed_sharded_tokens_are_inactive(clients):
+    """Test that a token not minted by the cluster is inactive on a sharded node, as with the handler."""
+    app, fast, slow = clients
+    provider = app.state.oauth_provider
+    provider.sharding = ShardRouter("a", ShardedTokenCodec("secret"), HashRing(["a"]), {"a": provider.store})
+    forged = ShardedTokenCodec("other-secret").mint(0, 32)
+    assert_same(fast.post("/introspect", data={"token": forged}), slow.post("/introspect", data={"token": forged}))
+
+
+@pytest.mark.parametrize(
+    "request_method, request_headers",
+    [
+        ("POST", None),
+        ("POST", "content-type, Mcp-Protocol-Version"),
+        ("DELETE", None),
+        ("POST", "x-custom"),
+        ("PUT", "content-type, x-custom"),
+    ],
+)
+def test_preflight_matches_cors_middleware(clients, request_method: str, request_headers: str | None):
+    """Test that the precomputed preflight responses are the ones of the CORS middleware."""
+    _, fast, slow = clients
+    headers = {"origin": ORIGIN, "access-control-request-method": request_method}
+    if request_headers is not None:
+        headers["access-control-request-headers"] = request_headers
+
+    fast_response, slow_response = fast.options("/introspect", headers=headers), slow.options("/introspect", headers=headers)
+    assert (fast_response.status_code, dict(fast_response.headers), fast_response.content) == (
+        slow_response.status_code,
+        dict(slow_response.headers),
+        slow_response.content,
+    )
+
+
+def test_bench_runs_every_case():
+    """Test that the benchmark measures both apps on every kind of request."""
+    results = asyncio.run(run_bench(requests=20, traced=5))
+
+    assert {(result.case, result.app) for result in results} == {
+        (case.name, app) for case in build_cases("token") for app in ("handler", "fast path")
+    }
+    assert all(result.requests_per_second > 0 and result.peak_bytes_per_call > 0 for result in results)
@@ -0,0 +1,80 @@
+"""Tests for reloading the server settings in place."""
+
+from time import time
+
+import pytest
+from mcp.server.auth.provider import AccessToken
+from starlette.testclient import TestClient
+
+from authentic import main
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.logger import configure_logger, logger
+from authentic.oauth_server import build_oauth2_server, reload_oauth2_server
+
+
+def make_settings(**kwargs) -> AuthServerSettings:
+    return AuthServerSettings(auth_host="localhost", _env_file=None, **kwargs)
+
+
+def test_reload_preserves_tokens_and_updates_metadata(restore_log_level):
+    """Test that a reload swaps URLs and metadata while issued tokens keep working."""
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), make_settings(auth_port=9000))
+    provider = app.state.oauth_provider
+    provider.store.tables["tokens"]["mcp_token"] = AccessToken(token="mcp_token", client_id="client", scopes=["user"], expires_at=int(time()) + 60)
+    provider.store.tables["state_mapping"]["state"] = {"client_id": "client"}
+
+    new_auth_settings = SimpleAuthSettings(access_token_expiry=120, _env_file=None)
+    reload_oauth2_server(app, new_auth_settings, make_settings(auth_port=9100, log_level="warning"))
+
+    assert app.state.oauth_provider is provider
+    assert provider.settings is new_auth_settings
+    assert provider.auth_url == "http://localhost:9100/login"
+    assert provider.store.tables["state_mapping"]["state"] == {"client_id": "client"}
+
+    client = TestClient(app)
+    metadata = client.get("/.well-known/oauth-authorization-server").json()
+    assert metadata["issuer"] == "http://localhost:9100/"
+    assert metadata["token_endpoint"] == "http://localhost:9100/token"
+
+    introspection = client.post("/introspect", data={"token": "mcp_token"}).json()
+    assert introspection["active"] is True
+    assert introspection["client_id"] == "client"
+
+
+def test_reload_with_invalid_settings_keeps_current_ones():
+    """Test that settings rejected while rebuilding the routes leave the server untouched."""
+    auth_settings = SimpleAuthSettings(_env_file=None)
+    app = build_oauth2_server(auth_settings, make_settings())
+    routes = app.router.routes
+
+    # The auth host is only validated when the server URLs are computed
+    with pytest.raises(ValueError):
+        reload_oauth2_server(app, SimpleAuthSettings(_env_file=None), AuthServerSettings(auth_host="bad host", _env_file=None))
+
+    assert app.router.routes is routes
+    assert app.state.oauth_provider.settings is auth_settings
+
+
+def test_invalid_log_level_is_rejected():
+    """Test that unknown log levels fail validation instead of breaking the logger."""
+    with pytest.raises(ValueError):
+        make_settings(log_level="verbose")
+    assert make_settings(log_level="warning").log_level == "WARNING"
+
+
+def test_restart_warning_lists_only_the_fields_changed_since_the_previous_load(monkeypatch: pytest.MonkeyPatch, restore_log_level):
+    """Test that reloading warns about the changed startup fields once, and not about the unchanged ones."""
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), make_settings(log_level="ERROR"))
+    new_settings = make_settings(log_level="WARNING", audit_batch_size=64)
+    monkeypatch.setattr(main, "load_settings", lambda debug: (new_settings, SimpleAuthSettings(_env_file=None)))
+    # Set the level first, reconfiguring the logger removes all its sinks
+    configure_logger("WARNING")
+    warnings = []
+    sink = logger.add(lambda message: warnings.append(message.record["message"]), level="WARNING")
+    try:
+        main.reload_settings(app, debug=False)
+        main.reload_settings(app, debug=False)
+    finally:
+        logger.remove(sink)
+
+    assert warnings == ["Changes to audit_batch_size only take effect after a restart"]
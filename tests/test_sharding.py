@@ -0,0 +1,321 @@
+"""Tests for partitioning the codes and tokens across several nodes."""
+
+import asyncio
+from collections import Counter
+from contextlib import ExitStack
+from time import time
+
+import pytest
+from mcp.server.auth.provider import AccessToken, AuthorizationCode
+from pydantic import AnyHttpUrl
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from authentic import main
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.oauth_server import build_oauth2_server, reshard_oauth2_server
+from authentic.sharding import HashRing, ShardedTokenCodec, ShardRouter
+from authentic.store.base import AUTH_CODES, TOKENS
+from authentic.store.redis_store import RedisStore
+from tests.oauth_flow import authorize, exchange
+from tests.resp_server import RespServer
+
+SECRET = "cluster-secret"
+
+
+def build_nodes(*node_ids: str) -> dict[str, Starlette]:
+    """Build in-process nodes, each one reaching the (memory) stores of the others."""
+    nodes = {
+        node_id: build_oauth2_server(
+            SimpleAuthSettings(_env_file=None),
+            AuthServerSettings(auth_host="localhost", node_id=node_id, shard_secret=SECRET, log_level="ERROR", _env_file=None),
+        )
+        for node_id in node_ids
+    }
+    stores = {node_id: app.state.oauth_provider.store for node_id, app in nodes.items()}
+    for node_id, app in nodes.items():
+        app.state.oauth_provider.sharding = ShardRouter(node_id, ShardedTokenCodec(SECRET), HashRing(node_ids), stores)
+    return nodes
+
+
+@pytest.fixture
+def resp_servers():
+    """A stand-in Redis server per node, as in production where each node has its own store."""
+    servers: dict[str, RespServer] = {}
+
+    def start(*node_ids: str) -> dict[str, RespServer]:
+        for node_id in node_ids:
+            servers[node_id] = RespServer().start()
+        return servers
+
+    yield start
+    for server in servers.values():
+        server.stop()
+
+
+def node_settings(node_id: str, servers: dict[str, RespServer], **kwargs) -> AuthServerSettings:
+    """Settings of a node with its own store and all the others as peers."""
+    return AuthServerSettings(
+        auth_host="localhost",
+        node_id=node_id,
+        shard_secret=SECRET,
+        store_url=servers[node_id].url,
+        shard_peers={peer: server.url for peer, server in servers.items() if peer != node_id},
+        log_level="ERROR",
+        _env_file=None,
+        **kwargs,
+    )
+
+
+def test_codec_rejects_malformed_tokens():
+    """Test that only tokens minted with the cluster secret are accepted, with their shard."""
+    codec = ShardedTokenCodec(SECRET)
+    token = codec.mint(0x2a, 32)
+    assert codec.parse(token) == 0x2a
+
+    tampered = token[:4] + "002b" + token[8:]
+    assert codec.parse(tampered) is None
+    assert codec.parse(ShardedTokenCodec("other-secret").mint(0x2a, 32)) is None
+    assert codec.parse(token[:-1]) is None
+    assert codec.parse(token[:-1] + "é") is None
+    assert codec.parse("mcp_" + "0" * 64) is None
+
+
+def test_ring_spreads_shards_and_moves_few_on_rebalance():
+    """Test that shards are spread over the nodes and adding one only moves shards to it."""
+    ring = HashRing(["a", "b", "c"], shards=1024)
+    before = ring.assignments()
+    assert all(count > 200 for count in Counter(before.values()).values())
+
+    ring.add_node("d")
+    after = ring.assignments()
+    moved = [shard for shard in before if before[shard] != after[shard]]
+    assert all(after[shard] == "d" for shard in moved)
+    assert 100 < len(moved) < 400
+
+
+def test_tokens_are_routed_to_their_node():
+    """Test that a code issued on one node is redeemed on another and its token introspected from any node."""
+    nodes = build_nodes("a", "b", "c")
+    clients = {node_id: TestClient(app) for node_id, app in nodes.items()}
+
+    registered, code, verifier = authorize(clients["a"])
+    assert nodes["a"].state.oauth_provider.sharding.owner(code) == "a"
+
+    token = exchange(clients["b"], registered, code, verifier).json()["access_token"]
+    assert nodes["b"].state.oauth_provider.sharding.owner(token) == "b"
+    assert token in nodes["b"].state.oauth_provider.store.tables[TOKENS]
+
+    for client in clients.values():
+        assert client.post("/introspect", data={"token": token}).json()["active"] is True
+
+
+def test_malformed_tokens_are_rejected_without_store_lookups(monkeypatch: pytest.MonkeyPatch):
+    """Test that introspecting a token with a bad checksum never reaches a store."""
+    nodes = build_nodes("a", "b")
+    lookups = []
+    for app in nodes.values():
+        store = app.state.oauth_provider.store
+        monkeypatch.setattr(store, "get", lambda table, key: lookups.append(key))
+
+    forged = ShardedTokenCodec("other-secret").mint(0, 32)
+    assert TestClient(nodes["a"]).post("/introspect", data={"token": forged}).json() == {"active": False}
+    assert lookups == []
+
+
+def test_rebalance_keeps_tokens_reachable():
+    """Test that after adding a node, tokens moved to it are still valid from every node."""
+    nodes = build_nodes("a", "b")
+    clients = {node_id: TestClient(app) for node_id, app in nodes.items()}
+    tokens = []
+    for _ in range(20):
+        registered, code, verifier = authorize(clients["a"])
+        tokens.append(exchange(clients["a"], registered, code, verifier).json()["access_token"])
+
+    nodes.update(build_nodes("c"))
+    clients["c"] = TestClient(nodes["c"])
+    ring = HashRing(["a", "b", "c"])
+    stores = {node_id: app.state.oauth_provider.store for node_id, app in nodes.items()}
+    moved = sum(asyncio.run(app.state.oauth_provider.sharding.rebalance(ring, stores)) for app in nodes.values())
+
+    assert moved > 0
+    assert nodes["c"].state.oauth_provider.store.tables[TOKENS]
+    # The registered clients were copied to the new node
+    assert nodes["c"].state.oauth_provider.store.tables["clients"]
+    for token in tokens:
+        for client in clients.values():
+            assert client.post("/introspect", data={"token": token}).json()["active"] is True
+
+
+def test_peers_require_a_shared_store():
+    """Test that a node with peers cannot keep its shards in a memory store they cannot reach."""
+    settings = AuthServerSettings(auth_host="localhost", node_id="a", shard_secret=SECRET, shard_peers={"b": "redis://b:6379/0"}, _env_file=None)
+    with pytest.raises(ValueError, match="store_url"):
+        build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+
+
+def test_shard_secret_is_not_printed():
+    """Test that the shard secret stays out of the settings printed at startup and on reload."""
+    settings = AuthServerSettings(auth_host="localhost", node_id="a", shard_secret=SECRET, _env_file=None)
+    assert SECRET not in str(settings) and SECRET not in repr(settings)
+    assert settings != AuthServerSettings(auth_host="localhost", node_id="a", shard_secret="other-secret", _env_file=None)
+    codec = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings).state.oauth_provider.sharding.codec
+    assert ShardedTokenCodec(SECRET).parse(codec.mint(0, 32)) == 0
+
+
+def test_nodes_built_from_settings_share_tokens(resp_servers):
+    """Test that nodes wired from their settings reach the tokens owned by each other over their stores."""
+    servers = resp_servers("a", "b")
+    nodes = {node_id: build_oauth2_server(SimpleAuthSettings(_env_file=None), node_settings(node_id, servers)) for node_id in servers}
+    assert nodes["a"].state.oauth_provider.sharding.ring.nodes == {"a", "b"}
+
+    with TestClient(nodes["a"]) as client_a, TestClient(nodes["b"]) as client_b:
+        registered, code, verifier = authorize(client_a)
+        token = exchange(client_a, registered, code, verifier).json()["access_token"]
+        assert any(key.startswith(b"authentic:tokens:") for key in servers["a"].data)
+        assert client_b.post("/introspect", data={"token": token}).json()["active"] is True
+
+
+def test_reshard_moves_tokens_over_redis(resp_servers):
+    """Test that resharding to a new peer moves the tokens it now owns to its store, found with SCAN."""
+    servers = resp_servers("a", "b")
+    nodes = {node_id: build_oauth2_server(SimpleAuthSettings(_env_file=None), node_settings(node_id, servers)) for node_id in servers}
+    with ExitStack() as stack:
+        clients = {node_id: stack.enter_context(TestClient(app)) for node_id, app in nodes.items()}
+        tokens = []
+        for _ in range(20):
+            registered, code, verifier = authorize(clients["a"])
+            tokens.append(exchange(clients["a"], registered, code, verifier).json()["access_token"])
+
+        resp_servers("c")
+        nodes["c"] = build_oauth2_server(SimpleAuthSettings(_env_file=None), node_settings("c", servers))
+        clients["c"] = stack.enter_context(TestClient(nodes["c"]))
+        moved = sum(
+            clients[node_id].portal.call(reshard_oauth2_server, nodes[node_id], node_settings(node_id, servers))
+            for node_id in ("a", "b", "c")
+        )
+
+        assert moved > 0
+        assert b"SCAN" in servers["a"].commands
+        assert any(key.startswith(b"authentic:tokens:") for key in servers["c"].data)
+        # The registered clients were copied to the new node
+        assert any(key.startswith(b"authentic:clients:") for key in servers["c"].data)
+        assert nodes["a"].state.oauth_provider.sharding.ring.nodes == {"a", "b", "c"}
+        for token in tokens:
+            for client in clients.values():
+                assert client.post("/introspect", data={"token": token}).json()["active"] is True
+
+
+def test_sighup_reshards_to_new_peers(resp_servers, monkeypatch: pytest.MonkeyPatch, restore_log_level):
+    """Test that reloading the settings with a new shard peer reshards the running node."""
+    servers = resp_servers("a")
+    settings = node_settings("a", servers)
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+    resp_servers("b")
+    monkeypatch.setattr(main, "load_settings", lambda debug: (node_settings("a", servers), SimpleAuthSettings(_env_file=None)))
+
+    async def reload():
+        main.reload_settings(app, debug=False)
+        await asyncio.gather(*main._background_tasks)
+
+    with TestClient(app) as client:
+        client.portal.call(reload)
+    assert app.state.oauth_provider.sharding.ring.nodes == {"a", "b"}
+    assert app.state.shard_peers == {"b": servers["b"].url}
+
+
+def test_requests_during_a_rebalance_over_redis(resp_servers):
+    """Test that codes consumed, tokens revoked and tokens minted while a rebalance runs stay so afterwards."""
+    servers = resp_servers("a", "b", "c")
+
+    async def scenario():
+        stores = {node_id: RedisStore(server.url) for node_id, server in servers.items()}
+        codec = ShardedTokenCodec(SECRET)
+        router = ShardRouter("a", codec, HashRing(["a", "b"]), {"a": stores["a"], "b": stores["b"]})
+        new_ring = HashRing(["a", "b", "c"])
+        moving = [shard for shard, node in new_ring.assignments().items() if node == "c" and router.ring.owner(shard) == "a"]
+        expires_at = int(time()) + 60
+        codes = [codec.mint(moving[i % len(moving)], 16) for i in range(10)]
+        tokens = [codec.mint(moving[i % len(moving)], 32) for i in range(10)]
+        for code in codes:
+            await stores["a"].set(AUTH_CODES, code, AuthorizationCode(
+                code=code, client_id="client", redirect_uri=AnyHttpUrl("http://localhost/cb"), redirect_uri_provided_explicitly=True,
+                expires_at=expires_at, scopes=["user"], code_challenge="challenge",
+            ), ttl=60)
+        for token in tokens:
+            await stores["a"].set(TOKENS, token, AccessToken(token=token, client_id="client", scopes=["user"], expires_at=expires_at), ttl=60)
+
+        # Requests served by node a while the first code and token are copied to c
+        minted = []
+        set_on_c = stores["c"].set
+
+        async def set_and_interleave(table, key, value, ttl=None):
+            await set_on_c(table, key, value, ttl=ttl)
+            if key == codes[0]:
+                # The code is exchanged once copied, before being consumed from a
+                assert await router.store_for(key).pop(AUTH_CODES, key) is not None
+                # A token not copied yet is revoked, another one is issued
+                assert await router.store_for(tokens[-1]).delete(TOKENS, tokens[-1])
+                token = router.mint(32)
+                await router.store_for(token).set(TOKENS, token, AccessToken(token=token, client_id="client", scopes=["user"], expires_at=expires_at), ttl=60)
+                minted.append(token)
+
+        stores["c"].set = set_and_interleave
+        moved = await router.rebalance(new_ring, stores)
+
+        assert moved == len(codes) + len(tokens) - 2
+        # The exchanged code is gone from both nodes, the others moved to c
+        assert await stores["c"].get(AUTH_CODES, codes[0]) is None
+        for code in codes[1:]:
+            assert await stores["c"].get(AUTH_CODES, code) is not None
+        assert await stores["a"].get(AUTH_CODES, codes[0]) is None
+        # The revoked token does not come back
+        assert await router.store_for(tokens[-1]).get(TOKENS, tokens[-1]) is None
+        for token in tokens[:-1]:
+            assert await stores["c"].get(TOKENS, token) is not None
+        # The token issued meanwhile was minted on a shard a keeps
+        assert router.owner(minted[0]) == "a"
+        assert await router.store_for(minted[0]).get(TOKENS, minted[0]) is not None
+        assert await stores["a"].keys(AUTH_CODES) == []
+        assert await stores["a"].keys(TOKENS) == [minted[0]]
+        for store in stores.values():
+            await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_reshard_reuses_the_clients_of_unchanged_peers(resp_servers, monkeypatch: pytest.MonkeyPatch):
+    """Test that resharding keeps the clients of unchanged peers, and closes the new ones if it fails."""
+    servers = resp_servers("a", "b")
+    app = build_oauth2_server(SimpleAuthSettings(_env_file=None), node_settings("a", servers))
+    sharding = app.state.oauth_provider.sharding
+    closed = []
+    close = RedisStore.close
+
+    async def record_close(self):
+        closed.append(self)
+        await close(self)
+
+    monkeypatch.setattr(RedisStore, "close", record_close)
+
+    async def fail(ring, stores):
+        raise RuntimeError("peer unreachable")
+
+    with TestClient(app) as client:
+        peer_b = sharding.stores["b"]
+        resp_servers("c")
+        monkeypatch.setattr(sharding, "rebalance", fail)
+        with pytest.raises(RuntimeError):
+            client.portal.call(reshard_oauth2_server, app, node_settings("a", servers))
+        assert len(closed) == 1 and closed[0] is not peer_b
+        assert sharding.stores["b"] is peer_b and app.state.shard_peers == {"b": servers["b"].url}
+
+        monkeypatch.undo()
+        monkeypatch.setattr(RedisStore, "close", record_close)
+        client.portal.call(reshard_oauth2_server, app, node_settings("a", servers))
+        assert sharding.stores["b"] is peer_b and len(closed) == 1
+
+        # The client of a removed peer is closed once the requests in flight had time to finish
+        without_b = {node_id: server for node_id, server in servers.items() if node_id != "b"}
+        client.portal.call(reshard_oauth2_server, app, node_settings("a", without_b), 0)
+        assert closed[-1] is peer_b and sharding.ring.nodes == {"a", "c"}
@@ -0,0 +1,32 @@
+"""Tests for the soak test harness."""
+
+import asyncio
+
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.soak import FLOW_WEIGHTS, SoakRunner
+
+
+def make_runner() -> SoakRunner:
+    auth_settings = SimpleAuthSettings(auth_code_expiry=2, access_token_expiry=2, flow_expiry=2, client_secret_expiry=4, _env_file=None)
+    auth_server_settings = AuthServerSettings(auth_host="localhost", log_level="ERROR", _env_file=None)
+    return SoakRunner(auth_settings, auth_server_settings, seed=7)
+
+
+def test_short_soak_leaves_nothing_behind():
+    """Test that every flow of the mix runs fine and all their state expires."""
+    report = asyncio.run(make_runner().run(flows=400, snapshot_every=100, warmup=0))
+
+    assert report.passed, report.failures
+    assert set(report.flows) == set(FLOW_WEIGHTS)
+    final = report.samples[-1]
+    # Only the user data of the single demo user is kept forever
+    assert {table: usage.entries for table, usage in final.items() if usage.entries} == {"user_data": 1}
+    assert report.top_sites
+
+
+def test_table_growth_beyond_the_bound_fails():
+    """Test that the run fails when a table grows beyond the bound after the warmup."""
+    report = asyncio.run(make_runner().run(flows=100, snapshot_every=20, warmup=0, max_table_growth=0))
+
+    assert not report.passed
+    assert all(failure.startswith("Table ") for failure in report.failures)
@@ -0,0 +1,139 @@
+"""Tests for the provider state stores."""
+
+import asyncio
+from time import time
+
+import pytest
+from mcp.server.auth.provider import AccessToken
+from starlette.testclient import TestClient
+
+from authentic.config.auth import AuthServerSettings, SimpleAuthSettings
+from authentic.oauth_server import build_oauth2_server
+from authentic.store import MemoryStore, create_store
+from authentic.store.redis_store import RedisStore
+from tests.oauth_flow import authorize, exchange
+from tests.resp_server import RespServer
+
+
+@pytest.fixture
+def resp_server():
+    server = RespServer().start()
+    yield server
+    server.stop()
+
+
+def test_memory_store_ttl_and_pop():
+    """Test that entries expire after their ttl and pop consumes them once."""
+    async def scenario():
+        store = MemoryStore()
+        await store.set("auth_codes", "code", "value", ttl=0)
+        await store.set("tokens", "token", "value", ttl=60)
+        assert await store.get("auth_codes", "code") is None
+        assert "code" not in store.tables["auth_codes"]
+        assert await store.get_many("tokens", ["token", "missing"]) == ["value", None]
+        assert await store.pop("tokens", "token") == "value"
+        assert await store.pop("tokens", "token") is None
+        assert store.deadlines["tokens"] == {}
+
+    asyncio.run(scenario())
+
+
+def test_memory_store_sweeps_entries_never_accessed_again():
+    """Test that expired entries are dropped by the sweep run from set()."""
+    async def scenario():
+        store = MemoryStore(sweep_interval=0)
+        await store.set("state_mapping", "abandoned", {}, ttl=0)
+        await store.set("clients", "client", {})
+        assert store.tables["state_mapping"] == {}
+        assert store.deadlines["state_mapping"] == {}
+        assert store.expiry_heaps["state_mapping"] == []
+
+    asyncio.run(scenario())
+
+
+def test_memory_store_sweep_skips_outdated_deadlines():
+    """Test that the deadline left in the heap by an entry set again or deleted does not drop it."""
+    async def scenario():
+        store = MemoryStore(sweep_interval=60)
+        await store.set("tokens", "renewed", "old", ttl=0)
+        await store.set("tokens", "renewed", "new", ttl=60)
+        await store.set("tokens", "kept", "old", ttl=0)
+        await store.set("tokens", "kept", "new")
+        await store.set("tokens", "deleted", "value", ttl=0)
+        await store.delete("tokens", "deleted")
+
+        assert store.sweep() == 0
+        assert store.tables["tokens"] == {"renewed": "new", "kept": "new"}
+        assert store.expiry_heaps["tokens"] == [(store.deadlines["tokens"]["renewed"], "renewed")]
+
+    asyncio.run(scenario())
+
+
+def test_redis_store(resp_server: RespServer):
+    """Test the Redis store operations, ttls and pipelined lookups against the stand-in server."""
+    async def scenario():
+        store = create_store(resp_server.url, pool_size=2)
+        assert isinstance(store, RedisStore)
+        token = AccessToken(token="mcp_a", client_id="client", scopes=["user"], expires_at=int(time()) + 60)
+        await store.set("tokens", "mcp_a", token, ttl=60)
+        await store.set("user_data", "fps", {"username": "fps"})
+
+        assert await store.get("tokens", "mcp_a") == token
+        assert await store.get("user_data", "fps") == {"username": "fps"}
+        assert 0 < resp_server.ttl_ms("authentic:tokens:mcp_a") <= 60_000
+        assert resp_server.ttl_ms("authentic:user_data:fps") == -1
+
+        resp_server.commands.clear()
+        resp_server.reads = 0
+        assert await store.get_many("tokens", ["mcp_a", "mcp_b", "mcp_c"]) == [token, None, None]
+        # All the lookups in a single round trip
+        assert resp_server.commands == [b"GET", b"GET", b"GET"]
+        assert resp_server.reads == 1
+
+        assert await store.pop("tokens", "mcp_a") == token
+        assert await store.pop("tokens", "mcp_a") is None
+        assert await store.delete("user_data", "fps") is True
+        assert await store.delete("user_data", "fps") is False
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_access_tokens_loaded_in_a_single_round_trip(resp_server: RespServer):
+    """Test that a batch of access tokens is loaded with a single pipelined lookup, skipping the expired ones."""
+    settings = AuthServerSettings(auth_host="localhost", store_url=resp_server.url, _env_file=None)
+    provider = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings).state.oauth_provider
+
+    async def scenario():
+        now = int(time())
+        valid = AccessToken(token="mcp_valid", client_id="client", scopes=["user"], expires_at=now + 60)
+        expired = AccessToken(token="mcp_expired", client_id="client", scopes=["user"], expires_at=now - 1)
+        await provider.store.set("tokens", "mcp_valid", valid, ttl=60)
+        await provider.store.set("tokens", "mcp_expired", expired, ttl=60)
+
+        resp_server.commands.clear()
+        resp_server.reads = 0
+        assert await provider.load_access_tokens(["mcp_valid", "mcp_missing", "mcp_expired"]) == [valid, None, None]
+        assert resp_server.commands == [b"GET", b"GET", b"GET"]
+        assert resp_server.reads == 1
+        await provider.store.close()
+
+    asyncio.run(scenario())
+
+
+def test_code_redeemed_on_another_node(resp_server: RespServer):
+    """Test that a code issued by one node is redeemed once on another one, whose token is valid everywhere."""
+    settings = AuthServerSettings(auth_host="localhost", store_url=resp_server.url, _env_file=None)
+    node_a = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+    node_b = build_oauth2_server(SimpleAuthSettings(_env_file=None), settings)
+
+    with TestClient(node_a) as client_a, TestClient(node_b) as client_b:
+        registered, code, verifier = authorize(client_a)
+
+        token = exchange(client_b, registered, code, verifier)
+        assert token.status_code == 200
+        assert exchange(client_a, registered, code, verifier).status_code == 400
+
+        introspection = client_a.post("/introspect", data={"token": token.json()["access_token"]}).json()
+        assert introspection["active"] is True
+        assert introspection["client_id"] == registered["client_id"]